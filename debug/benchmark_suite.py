@@ -0,0 +1,241 @@
+# Benchmark suite for the hot paths of the diagnostics.
+#
+# Generates synthetic data (see synthetic_data.py), then times a set of
+# scenarios: manifest scanning, station obs parsing, cache writes, station
+# sampling, horizontal / vertical regridding, zonal statistics, total mass and
+# movie rendering.
+# The results are written as JSON, so runs can be compared across commits.
+# Everything runs offline, in a scratch directory.
+#
+# Usage: python debug/benchmark_suite.py [options]
+# (run from the top-level directory of the package, see --help for options)
+
+import numpy as np
+from time import time
+
+# Table of scenarios (filled in by the @scenario decorator)
+scenarios = []
+def scenario (f):
+  scenarios.append(f)
+  return f
+
+# Open the synthetic model experiment as a data product.
+def open_model (workdir, files):
+  from os.path import join
+  from eccas_diags.interfaces import DataInterface
+  from eccas_diags.interfaces.data_scanner import from_files
+  datasets = from_files(files, 'netcdf', manifest=join(workdir,'manifest'))
+  model = DataInterface(datasets)
+  model.name = 'synthetic'
+  return model
+
+
+@scenario
+def scan_manifest (workdir, data):
+  from os.path import join, exists
+  from os import remove
+  from eccas_diags.interfaces.data_scanner import from_files
+  manifest = join(workdir,'scan_manifest')
+  if exists(manifest): remove(manifest)
+  start = time()
+  from_files(data['model'], 'netcdf', manifest=manifest)
+  cold = time() - start
+  start = time()
+  from_files(data['model'], 'netcdf', manifest=manifest)
+  warm = time() - start
+  return dict(cold=cold, warm=warm)
+
+@scenario
+def parse_station_obs (workdir, data):
+  from eccas_diags import station_data
+  from eccas_diags.interfaces.ec_station_data import EC_Station_Data
+  from eccas_diags.interfaces.gaw_station_data import GAW_Station_Data
+  station_data.parsed_cache_dir = None
+  station_data._parsed.clear()
+  start = time()
+  for filename in data['ec_obs']:
+    EC_Station_Data.open_file(filename)
+  ec = time() - start
+  start = time()
+  for filename in data['gaw_obs']:
+    GAW_Station_Data.open_file(filename)
+  gaw = time() - start
+  return dict(ec=ec, gaw=gaw)
+
+@scenario
+def cache_write (workdir, data):
+  from os.path import join
+  from shutil import rmtree
+  from eccas_diags.cache import Cache
+  cachedir = join(workdir,'cache')
+  rmtree(cachedir, ignore_errors=True)
+  cache = Cache(cachedir)
+  co2 = data['product'].find_best('CO2')
+  start = time()
+  cache.write(co2, prefix='bench_CO2')
+  cold = time() - start
+  start = time()
+  cache.write(co2, prefix='bench_CO2')
+  warm = time() - start
+  return dict(cold=cold, warm=warm)
+
+@scenario
+def station_sample (workdir, data):
+  from eccas_diags.station_data import Station
+  from eccas_diags.diagnostics.station import StationSample
+  nstations = 50
+  lat = np.linspace(-80, 80, nstations)
+  lon = np.linspace(0, 350, nstations)
+  names = ['station%03d'%i for i in range(nstations)]
+  stations = Station(names, station=names, lat=lat, lon=lon)
+  co2 = data['product'].find_best('CO2')
+  start = time()
+  StationSample(co2, stations).get()
+  return dict(total=time()-start)
+
+@scenario
+def horz_regrid (workdir, data):
+  from pygeode.axis import Lat, Lon
+  from eccas_diags.regrid_horz_wrapper import HorzRegrid
+  co2 = data['product'].find_best('CO2')
+  target_lat = Lat(np.linspace(-89, 89, 90))
+  target_lon = Lon(np.arange(180)*2.)
+  start = time()
+  HorzRegrid(co2, target_lat, target_lon).get()
+  return dict(total=time()-start)
+
+@scenario
+def vert_regrid (workdir, data):
+  from pygeode.var import Var
+  from eccas_diags.regrid_vert_wrapper import VertRegrid
+  co2, dp = data['product'].find_best(['CO2','dp'])
+  dp = dp.load()
+  zdim = dp.whichaxis('zaxis')
+  # Pressure at the middle of each level, and surface pressure.
+  p = np.cumsum(dp.get(), axis=zdim) - 0.5*dp.get()
+  source_p = Var(dp.axes, values=p, name='p', atts=dict(units='Pa'))
+  p0 = dp.sum('zaxis').load()
+  p0.atts['units'] = 'Pa'
+  # Target: same levels, with slightly perturbed thicknesses.
+  target_dp = (dp*1.01).load()
+  target_dp.atts['units'] = 'Pa'
+  target_p = Var(dp.axes, values=np.cumsum(target_dp.get(), axis=zdim) - 0.5*target_dp.get(), name='p', atts=dict(units='Pa'))
+  start = time()
+  VertRegrid(p0, source_p, dp, target_p, target_dp, co2).get()
+  return dict(total=time()-start)
+
+@scenario
+def zonal_stats (workdir, data):
+  from eccas_diags.common import nanstats
+  co2 = data['product'].find_best('CO2')
+  start = time()
+  co2.nanmean('lon').get()
+  mean = time() - start
+  start = time()
+  for v in nanstats(co2, 'lon', ['mean','stdev']): v.get()
+  fused = time() - start
+  return dict(mean=mean, mean_and_stdev=fused)
+
+@scenario
+def totalmass (workdir, data):
+  from eccas_diags.diagnostics.totalmass import Totalmass
+  from eccas_diags.interfaces import DataInterface
+  from pygeode.dataset import Dataset
+  co2, dp, area = data['product'].find_best(['CO2','dp','cell_area'])
+  area = area.rename('blended_area')
+  product = DataInterface([Dataset([co2,dp,area])])
+  product.name = 'synthetic'
+  diag = Totalmass(fieldname='CO2', units='Pg(C)', outdir=workdir)
+  start = time()
+  diag._compute_totalmass(product, cache=False).get()
+  return dict(total=time()-start)
+
+@scenario
+def movie (workdir, data):
+  import matplotlib
+  matplotlib.use('Agg')
+  from os.path import join
+  from shutil import rmtree
+  from eccas_diags.diagnostics.movie import ContourMovie
+  outdir = join(workdir,'movie')
+  rmtree(outdir, ignore_errors=True)
+  field = data['product'].find_best('CO2').mean('zaxis')
+  movie = ContourMovie([field], title='benchmark', subtitles=['CO2'], shape=(1,1), aspect_ratio=0.5)
+  start = time()
+  movie.save(outdir=outdir, prefix='bench')
+  return dict(total=time()-start, frames=len(field.time))
+
+
+# Get a description of the code version being benchmarked.
+def code_version ():
+  from subprocess import Popen, PIPE
+  try:
+    proc = Popen(['git','describe','--always','--dirty'], stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    return out.strip()
+  except OSError:
+    return None
+
+if __name__ == '__main__':
+  import argparse
+  import json
+  import platform
+  from os.path import join
+  from datetime import datetime
+  from tempfile import mkdtemp
+  import synthetic_data
+
+  parser = argparse.ArgumentParser(description="Run the benchmark suite on synthetic data.")
+  parser.add_argument('--workdir', help="Scratch directory for the synthetic data and outputs.  Default is a new temporary directory.")
+  parser.add_argument('--output', default='benchmark_results.json', help="Where to write the results.  Default is %(default)s.")
+  parser.add_argument('--repeats', type=int, default=3, help="Number of times to run each scenario (the best time is kept).  Default is %(default)s.")
+  parser.add_argument('--only', help="Comma-separated list of scenarios to run.  Available: "+', '.join(f.__name__ for f in scenarios))
+  parser.add_argument('--nlat', type=int, default=45)
+  parser.add_argument('--nlon', type=int, default=90)
+  parser.add_argument('--nlev', type=int, default=20)
+  parser.add_argument('--ntracers', type=int, default=3)
+  parser.add_argument('--ndays', type=int, default=5)
+  parser.add_argument('--steps-per-day', type=int, default=4)
+  parser.add_argument('--nstations', type=int, default=10)
+  parser.add_argument('--obs-days', type=int, default=365)
+  args = parser.parse_args()
+
+  workdir = args.workdir or mkdtemp(prefix='eccas-bench-')
+  config = dict((k,v) for k,v in vars(args).items() if k not in ('workdir','output','only'))
+
+  print "Generating synthetic data in", workdir
+  data = {}
+  data['model'] = synthetic_data.make_model(join(workdir,'model'), args.nlat, args.nlon, args.nlev, args.ntracers, args.ndays, args.steps_per_day)
+  data['ec_obs'] = synthetic_data.make_ec_obs(join(workdir,'EC-obs'), args.nstations, args.obs_days)
+  data['gaw_obs'] = synthetic_data.make_gaw_obs(join(workdir,'GAW-obs','hourly'), args.nstations, args.obs_days)
+  data['product'] = open_model(workdir, data['model'])
+
+  selected = scenarios
+  if args.only is not None:
+    selected = [f for f in scenarios if f.__name__ in args.only.split(',')]
+
+  results = {}
+  for f in selected:
+    name = f.__name__
+    try:
+      runs = [f(workdir, data) for i in range(args.repeats)]
+      # Keep the best time for each measurement.
+      results[name] = dict((k,min(r[k] for r in runs)) for k in runs[0])
+      print "%-20s %s"%(name, ', '.join('%s=%.3fs'%(k,v) for k,v in sorted(results[name].items()) if isinstance(v,float)))
+    # Some scenarios need compiled extensions (regridding), which may not be
+    # available everywhere.
+    except ImportError as e:
+      results[name] = dict(skipped=str(e))
+      print "%-20s skipped (%s)"%(name, e)
+
+  report = dict(
+    version = code_version(),
+    date = datetime.now().isoformat(),
+    host = platform.node(),
+    python = platform.python_version(),
+    config = config,
+    results = results,
+  )
+  with open(args.output,'w') as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+  print "Results written to", args.output
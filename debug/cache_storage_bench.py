@@ -0,0 +1,93 @@
+# Benchmark for the storage options of the cache files.
+#
+# Writes a gridded field (time, lat, lon) into the cache with different
+# formats and compression / quantization / chunking settings, then reports the
+# size of each file, and how long it takes to read it back with the two main
+# access patterns:
+#   map        - one timestep at a time, over the whole domain (movies).
+#   timeseries - all timesteps at once, at a few points (station samples).
+#
+# Usage: python debug/cache_storage_bench.py [options]
+# (run from the top-level directory of the package, see --help for options)
+
+import numpy as np
+from time import time
+
+# Storage settings to try: (label, Cache arguments, access pattern).
+settings = [
+  ('uncompressed', dict(), None),
+  ('zlib1', dict(compress=1), None),
+  ('zlib4+shuffle', dict(compress=4), None),
+  ('zlib4+shuffle+3digits', dict(compress=4, significant_digits=3), None),
+  ('zlib4+shuffle, map chunks', dict(compress=4, chunking=True), 'map'),
+  ('zlib4+shuffle, timeseries chunks', dict(compress=4, chunking=True), 'timeseries'),
+  ('zlib4+shuffle+3digits, map chunks', dict(compress=4, significant_digits=3, chunking=True), 'map'),
+  ('zlib4+shuffle+3digits, timeseries chunks', dict(compress=4, significant_digits=3, chunking=True), 'timeseries'),
+  ('npy memmap', dict(format='npy'), None),
+]
+
+# Make a smooth(ish) field, with some noise.
+def make_field (ntime, nlat, nlon):
+  from pygeode.axis import Lat, Lon
+  from pygeode.timeaxis import StandardTime
+  from pygeode.var import Var
+  rand = np.random.RandomState(0)
+  time = StandardTime(values=np.arange(ntime)*6., units='hours', startdate=dict(year=2010,month=1,day=1))
+  lat = Lat(np.linspace(-89,89,nlat))
+  lon = Lon(np.arange(nlon)*360./nlon)
+  t = np.arange(ntime).reshape(-1,1,1)
+  y = np.linspace(-1,1,nlat).reshape(1,-1,1)
+  x = np.linspace(0,2*np.pi,nlon).reshape(1,1,-1)
+  values = 400 + 10*y + 5*np.sin(x+t/20.) + 0.1*rand.standard_normal((ntime,nlat,nlon))
+  return Var([time,lat,lon], values=values.astype('float32'), name='CO2', atts=dict(units='ppm'))
+
+def read_maps (var):
+  start = time()
+  for i in range(len(var.time)):
+    var(i_time=i).get()
+  return time() - start
+
+def read_timeseries (var, npoints):
+  rand = np.random.RandomState(1)
+  start = time()
+  for k in range(npoints):
+    var(i_lat=rand.randint(len(var.lat)), i_lon=rand.randint(len(var.lon))).get()
+  return time() - start
+
+if __name__ == '__main__':
+  import argparse
+  import json
+  from os.path import getsize, join
+  from shutil import rmtree
+  from tempfile import mkdtemp
+  from eccas_diags.cache import Cache
+
+  parser = argparse.ArgumentParser(description="Benchmark the storage options of the cache files.")
+  parser.add_argument('--workdir', help="Scratch directory for the cache files.  Default is a new temporary directory.")
+  parser.add_argument('--output', help="Also write the results to this JSON file.")
+  parser.add_argument('--ntime', type=int, default=1460)
+  parser.add_argument('--nlat', type=int, default=90)
+  parser.add_argument('--nlon', type=int, default=180)
+  parser.add_argument('--npoints', type=int, default=20, help="Number of points to read for the timeseries pattern.  Default is %(default)s.")
+  args = parser.parse_args()
+
+  workdir = args.workdir or mkdtemp(prefix='eccas-cache-bench-')
+  field = make_field(args.ntime, args.nlat, args.nlon).load()
+
+  results = {}
+  print "%-45s %10s %10s %12s"%("setting", "size (MB)", "maps (s)", "points (s)")
+  for label, options, access in settings:
+    cachedir = join(workdir, label.replace(' ','_').replace(',','').replace('+','_'))
+    rmtree(cachedir, ignore_errors=True)
+    cache = Cache(cachedir, **options)
+    filename = cache.where_write(field, prefix='bench', split_time=False, access=access)
+    var = cache.write(field, prefix='bench', split_time=False, access=access)
+    size = getsize(filename)/1E6
+    maps = read_maps(var)
+    points = read_timeseries(var, args.npoints)
+    results[label] = dict(size_mb=size, map_read=maps, timeseries_read=points)
+    print "%-45s %10.2f %10.3f %12.3f"%(label, size, maps, points)
+
+  if args.output is not None:
+    with open(args.output,'w') as f:
+      json.dump(dict(shape=[args.ntime,args.nlat,args.nlon], npoints=args.npoints, results=results), f, indent=2, sort_keys=True)
@@ -0,0 +1,39 @@
+# Benchmark for the start-up time of the command-line entry points.
+# Runs each command a few times, and reports the best wall-clock time.
+# Also times importing every interface and diagnostic up front, for
+# comparison with the lazy lookup tables.
+#
+# Usage: python debug/startup_bench.py [repeats]
+# (run from the top-level directory of the package)
+
+import sys
+from subprocess import call
+from time import time
+from os import devnull
+
+python = sys.executable
+
+commands = [
+  ('eccas-diags --list-diagnostics', [python, 'eccas-diags', '--list-diagnostics']),
+  ('eccas-diags --list-interfaces', [python, 'eccas-diags', '--list-interfaces']),
+  ('eccas-diags --help', [python, 'eccas-diags', '--help']),
+  ('eccas-diags --help (one diagnostic)', [python, 'eccas-diags', '--diagnostics', 'timeseries', '--help']),
+  ('eccas-check-interface --help', [python, 'eccas-check-interface', '--help']),
+  ('eccas-regrid --help', [python, 'eccas-regrid', '--help']),
+  ('eccas-met-diags --help', [python, 'eccas-met-diags', '--help']),
+  ('import everything (eager)', [python, '-c', 'from eccas_diags import diagnostics, interfaces; diagnostics.table.load_all(); interfaces.table.load_all()']),
+]
+
+def best_time (cmd, repeats):
+  times = []
+  with open(devnull,'w') as null:
+    for i in range(repeats):
+      start = time()
+      call(cmd, stdout=null, stderr=null)
+      times.append(time()-start)
+  return min(times)
+
+if __name__ == '__main__':
+  repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+  for name, cmd in commands:
+    print "%-35s %8.3fs"%(name, best_time(cmd, repeats))
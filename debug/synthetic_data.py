@@ -0,0 +1,157 @@
+# Generate synthetic data for benchmarking the diagnostics.
+#
+# Creates a GEM-like model experiment (one netCDF file per timestep, with 3D
+# tracer fields, pressure thickness and cell area), and station observation
+# files in the 'ec-station-obs' and 'gaw-station-obs' text formats.
+#
+# Usage: python debug/synthetic_data.py OUTDIR [options]
+# (see --help for the resolution, number of tracers, etc.)
+
+import numpy as np
+
+# Stations that are known to the ec-station-obs interface.
+ec_stations = ['Alert', 'Candle_Lake', 'Egbert', 'Chibougamau', 'Estevan_Point', 'Fraserdale', 'Lac_Labiche', 'Sable_Island', 'Bratts_Lake', 'Esther', 'Toronto', 'East_Trout_Lake', 'Behchoko', 'Churchill', 'Cambridge_Bay', 'Abbotsford', 'Inuvik', 'Turkey_Point', 'Chapais', 'Baker_Lake']
+
+startdate = dict(year=2010, month=1, day=1)
+
+# Axes for the model grid.
+def model_axes (nlat, nlon, nlev):
+  from pygeode.axis import Lat, Lon, Pres
+  lat = Lat((np.arange(nlat)+0.5)*180./nlat - 90)
+  lon = Lon(np.arange(nlon)*360./nlon)
+  pres = Pres(np.linspace(1000., 10., nlev))
+  return lat, lon, pres
+
+# Create a single timestep of model output.
+def model_timestep (hour, nlat, nlon, nlev, tracers, seed=0):
+  from pygeode.var import Var
+  from pygeode.timeaxis import StandardTime
+  from pygeode.dataset import Dataset
+  from eccas_diags.common import get_area
+  rand = np.random.RandomState(seed+hour)
+  time = StandardTime(values=[hour], units='hours', startdate=startdate)
+  lat, lon, pres = model_axes(nlat, nlon, nlev)
+  shape = (1, nlev, nlat, nlon)
+  # Pressure thickness of each level (roughly 1000hPa total).
+  dp = np.empty(shape, dtype='float32')
+  dp[()] = 100000./nlev
+  dp *= 1 + 0.01*rand.standard_normal(shape).astype('float32')
+  vars = [Var([time,pres,lat,lon], values=dp, name='dp', atts=dict(units='Pa'))]
+  # Cell area (no time axis).
+  area = get_area(lat, lon)
+  area.name = 'cell_area'
+  vars.append(area)
+  # Tracers (mass mixing ratio).
+  for i, tracer in enumerate(tracers):
+    values = 6e-4 * (1 + 0.05*i + 0.01*rand.standard_normal(shape))
+    vars.append(Var([time,pres,lat,lon], values=values.astype('float32'), name=tracer, atts=dict(units='kg kg(air)-1', specie='CO2')))
+  return Dataset(vars)
+
+# Write out a synthetic model experiment (one file per timestep).
+def make_model (outdir, nlat=45, nlon=90, nlev=20, ntracers=3, ndays=5, steps_per_day=4):
+  from os.path import exists, join
+  from os import makedirs
+  from pygeode.formats import netcdf
+  if not exists(outdir): makedirs(outdir)
+  tracers = ['CO2'] + ['CO2_%02d'%i for i in range(1,ntracers)]
+  filenames = []
+  for n in range(ndays*steps_per_day):
+    hour = n*24//steps_per_day
+    filename = join(outdir, 'model_%04d.nc'%n)
+    if not exists(filename):
+      netcdf.save(filename, model_timestep(hour, nlat, nlon, nlev, tracers))
+    filenames.append(filename)
+  return filenames
+
+# Write station obs in the ec-station-obs format (comma-separated).
+def make_ec_obs (outdir, nstations=10, ndays=365):
+  from os.path import exists, join
+  from os import makedirs
+  if not exists(outdir): makedirs(outdir)
+  rand = np.random.RandomState(1)
+  filenames = []
+  nhours = ndays*24
+  doy = np.arange(nhours)//24 + 1
+  hourend = np.arange(nhours)%24 + 1
+  for station in ec_stations[:nstations]:
+    filename = join(outdir, '%s-CO2-Hourly.DAT'%station)
+    mean = 390 + 5*rand.standard_normal(nhours)
+    with open(filename,'w') as f:
+      f.write('DecimalYear,Year,DayOfYear,HourEnd,CO2_mean,CO2_max,CO2_min,CO2_std,nval\n')
+      for d, h, m in zip(doy, hourend, mean):
+        f.write('%.6f,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%d\n'%(startdate['year']+(d-1)/365., startdate['year'], d, h, m, m+1, m-1, 0.5, 60))
+    filenames.append(filename)
+  return filenames
+
+# Write station obs in the gaw-station-obs (WDCGG) format.
+def make_gaw_obs (outdir, nstations=10, ndays=365):
+  from os.path import exists, join, basename
+  from os import makedirs
+  from datetime import datetime, timedelta
+  if not exists(outdir): makedirs(outdir)
+  rand = np.random.RandomState(2)
+  filenames = []
+  nhours = ndays*24
+  start = datetime(**startdate)
+  for k in range(nstations):
+    name = 'Synthetic_%02d'%k
+    filename = join(outdir, 'syn%02d.gaw.fi.%02d.hr.co2.nl.hr%04d.dat'%(k,k,startdate['year']))
+    # Header lines C01 - C24.  The parser expects the station name on line 7,
+    # the parameter on line 18, and the time zone on line 24.
+    header = [
+      'TITLE: Synthetic hourly CO2',
+      'FILE NAME: '+basename(filename),
+      'DATA FORMAT: Version 1.0',
+      'TOTAL LINES: %d'%(nhours+26),
+      'HEADER LINES: 26',
+      'DATA VERSION: 1',
+      'STATION NAME: '+name,
+      'STATION CATEGORY: Global',
+      'OBSERVATION CATEGORY: Air sampling observation at a stationary platform',
+      'COUNTRY/TERITORY: Nowhere',
+      'SUBMITTED BY: Benchmark',
+      'LATITUDE: %.2f'%(-80+160.*k/max(nstations-1,1)),
+      'LONGITUDE: %.2f'%(-170+340.*k/max(nstations-1,1)),
+      'ALTITUDE: %d'%(10*k),
+      'CONTACT POINT: none',
+      'CALIBRATION: none',
+      'MEASUREMENT SCALE: WMO',
+      'PARAMETER: CO2',
+      'COVERING PERIOD: %04d'%startdate['year'],
+      'TIME INTERVAL: hourly',
+      'MEASUREMENT UNIT: ppm',
+      'MEASUREMENT METHOD: NDIR',
+      'SAMPLING TYPE: continuous',
+      'TIME ZONE: UTC',
+    ]
+    lines = ['C%02d %s\n'%(i+1,h) for i,h in enumerate(header)]
+    lines.append('C25\n')
+    lines.append('C26 DATE TIME DATE TIME CO2 ND SD F CS REM\n')
+    values = 390 + 5*rand.standard_normal(nhours)
+    with open(filename,'w') as f:
+      f.writelines(lines)
+      for i in range(nhours):
+        t1 = start + timedelta(hours=i)
+        t2 = t1 + timedelta(hours=1)
+        f.write('%s %s %s %s %10.3f %5d %8.3f %s %s %s\n'%(t1.strftime('%Y-%m-%d'), t1.strftime('%H:%M'), t2.strftime('%Y-%m-%d'), t2.strftime('%H:%M'), values[i], 1, 0.3, '...', '0', '-9999'))
+    filenames.append(filename)
+  return filenames
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description="Generate synthetic data for benchmarking the diagnostics.")
+  parser.add_argument('outdir', help="Where to put the generated data.")
+  parser.add_argument('--nlat', type=int, default=45)
+  parser.add_argument('--nlon', type=int, default=90)
+  parser.add_argument('--nlev', type=int, default=20)
+  parser.add_argument('--ntracers', type=int, default=3)
+  parser.add_argument('--ndays', type=int, default=5, help="Length of the model experiment (in days).")
+  parser.add_argument('--steps-per-day', type=int, default=4)
+  parser.add_argument('--nstations', type=int, default=10)
+  parser.add_argument('--obs-days', type=int, default=365, help="Length of the station records (in days).")
+  args = parser.parse_args()
+  from os.path import join
+  make_model(join(args.outdir,'model'), args.nlat, args.nlon, args.nlev, args.ntracers, args.ndays, args.steps_per_day)
+  make_ec_obs(join(args.outdir,'EC-obs'), args.nstations, args.obs_days)
+  make_gaw_obs(join(args.outdir,'GAW-obs','hourly'), args.nstations, args.obs_days)
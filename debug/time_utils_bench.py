@@ -0,0 +1,106 @@
+# Benchmark for the time utilities in eccas_diags.common / time_stats.
+# Compares the datetime64-based versions against the previous pure-Python
+# versions, on a 20-year hourly time axis.
+#
+# Usage: python debug/time_utils_bench.py [nyears]
+
+import sys
+from time import time
+import numpy as np
+from pygeode.var import Var
+from pygeode.timeaxis import StandardTime
+from eccas_diags.common import to_datetimes, same_times, detect_gaps
+from eccas_diags.calculations.time_stats import full_months
+
+
+# Previous implementations (for comparison).
+
+def old_to_datetimes(taxis):
+  from datetime import datetime,timedelta
+  ref = datetime(**taxis.startdate)
+  units = taxis.units
+  values = taxis.values
+  return [ref+timedelta(**{units:v}) for v in values]
+
+def old_full_months(var):
+  from datetime import timedelta
+  from pygeode.timeutils import delta
+  dates = old_to_datetimes(var.time)
+  dt = delta(var.time)
+  dt = timedelta(**{var.time.units:dt})
+  have_month_start = dict()
+  have_month_end = dict()
+  for date in dates:
+    ym = date.year, date.month
+    if (date-2*dt).month != date.month:
+      have_month_start[ym] = True
+    if (date+dt).month != date.month:
+      have_month_end[ym] = True
+  time_indices = []
+  for i,date in enumerate(dates):
+    ym = date.year, date.month
+    if have_month_start.get(ym,False) and have_month_end.get(ym,False):
+      time_indices.append(i)
+  return var.slice[time_indices,...]
+
+def old_same_times (*varlist):
+  from eccas_diags.common import fix_timeaxis
+  varlist = map(fix_timeaxis,varlist)
+  times = [set(var.time.values) for var in varlist]
+  times = reduce(set.intersection,times,times[0])
+  times = sorted(times)
+  return [var(l_time=times) for var in varlist]
+
+def old_detect_gaps(var):
+  from collections import Counter
+  from pygeode.var import copy_meta
+  if len(var.time) <= 1: return var
+  dt, count = Counter(np.diff(var.time.values)).most_common(1)[0]
+  if count < len(var.time)/10+2: return var
+  start = var.time.values[0]
+  stop = var.time.values[-1]
+  n = int(round((stop-start)/dt)) + 1
+  full_time = np.linspace(start, stop, n)
+  full_values = np.empty((len(full_time),)+var.shape[1:],dtype=var.dtype)
+  full_values[:] = float('nan')
+  indices = np.asarray(np.round((var.time.values-start)/dt),dtype=int)
+  full_values[indices,...] = var.get()
+  taxis = type(var.time)(startdate=var.time.startdate, units=var.time.units, values=full_time)
+  outvar = Var(axes=(taxis,)+var.axes[1:], values=full_values)
+  copy_meta (var, outvar)
+  return outvar
+
+
+def timed (f, *args):
+  start = time()
+  result = f(*args)
+  return time()-start, result
+
+def compare (name, old, new, args, check):
+  t_old, r_old = timed(old, *args)
+  t_new, r_new = timed(new, *args)
+  assert check(r_old, r_new), "%s: results differ"%name
+  print "%-14s old %8.3fs   new %8.3fs   speed-up %6.1fx"%(name, t_old, t_new, t_old/max(t_new,1e-9))
+
+
+if __name__ == '__main__':
+  nyears = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+  nhours = int(nyears*365.25*24)
+  print "Time axis: %d years of hourly data (%d timesteps)"%(nyears, nhours)
+  startdate = dict(year=1990, month=1, day=1)
+  # Start and end part-way through a month, so full_months has work to do.
+  taxis = StandardTime(values=np.arange(nhours)+200., units='hours', startdate=startdate)
+  var = Var([taxis], values=np.zeros(nhours), name='x')
+  # A second variable with every 3rd hour, for the overlap test.
+  taxis3 = StandardTime(values=np.arange(0,nhours,3)+200., units='hours', startdate=startdate)
+  var3 = Var([taxis3], values=np.zeros(len(taxis3)), name='y')
+  # A variable with some gaps in it.
+  keep = np.ones(nhours, dtype=bool)
+  keep[np.random.RandomState(0).randint(0,nhours,nhours//20)] = False
+  taxis_gaps = StandardTime(values=taxis.values[keep], units='hours', startdate=startdate)
+  var_gaps = Var([taxis_gaps], values=np.arange(keep.sum(),dtype='float64'), name='z')
+
+  compare ('to_datetimes', old_to_datetimes, to_datetimes, [taxis], lambda a,b: a == b)
+  compare ('full_months', old_full_months, full_months, [var], lambda a,b: np.all(a.time.values == b.time.values))
+  compare ('same_times', old_same_times, same_times, [var, var3], lambda a,b: all(np.all(x.time.values == y.time.values) for x,y in zip(a,b)))
+  compare ('detect_gaps', old_detect_gaps, detect_gaps, [var_gaps], lambda a,b: np.all(a.time.values == b.time.values))
@@ -67,16 +67,178 @@ def domain_hash (var):
   return data
 
 
+# Temporary filename to write to, before moving the file into place.
+# Unique to this process, so several processes (possibly on different nodes)
+# can safely try to create the same cache file at the same time.
+def _tmpfile (filename):
+  from socket import gethostname
+  from os import getpid
+  return "%s.tmp.%s.%d"%(filename, gethostname(), getpid())
+
+
+# Remove the time filters (date range, hour0-only, particular hour) from a
+# cache file suffix.  What's left needs to match for two cache files to hold
+# the same kind of data.
+def _non_time_filters (suffix):
+  import re
+  time_filter = re.compile(r'^(\d*-\d*|hour0-only|\d+GMT)$')
+  return [s for s in suffix.split('_') if s != '' and not time_filter.match(s)]
+
+
+# Generate the date strings used in the cache filenames for each timestep,
+# and the corresponding pattern for reading them back in.
+def _datestrings (taxis):
+  pattern = ""
+  if 'year' in taxis.auxarrays:
+    years = ["%04d"%y for y in taxis.auxarrays['year']]
+    pattern += "$Y"
+  else:
+    years = [''] * len(taxis)
+
+  if 'month' in taxis.auxarrays:
+    months = ["%02d"%m for m in taxis.auxarrays['month']]
+    pattern += "$m"
+  else:
+    months = [''] * len(taxis)
+
+  if 'day' in taxis.auxarrays:
+    days = ["%02d"%d for d in taxis.auxarrays['day']]
+    pattern += "$d"
+  else:
+    days = [''] * len(taxis)
+
+  if 'hour' in taxis.auxarrays:
+    hours = ["%02d"%h for h in taxis.auxarrays['hour']]
+    pattern += "$H"
+  else:
+    hours = [''] * len(taxis)
+
+  if 'minute' in taxis.auxarrays:
+    minutes = ["%02d"%m for m in taxis.auxarrays['minute']]
+    pattern += "$M"
+  else:
+    minutes = [''] * len(taxis)
+
+  datestrings = [y+m+d+H+M for y,m,d,H,M in zip(years,months,days,hours,minutes)]
+  return datestrings, pattern
+
+
+# Compute a good range for plotting the data (covers most of the values), and
+# store it in the 'low' and 'high' attributes.
+# The data must already be loaded in memory.
+def _set_ranges (var):
+  import numpy as np
+  try:
+    var.atts['low'] = np.nanpercentile(var.values, 0.1)
+    var.atts['high'] = np.nanpercentile(var.values, 99.9)
+  # Fall back for older versions of numpy.
+  except AttributeError:
+    sample = var.values.flatten()
+    # Filter out NaN values
+    sample = sample[np.isfinite(sample)]
+    # Get a good range (covers most values)
+    sample.sort()
+    N = len(sample)
+    low = sample[int(round((N-1)*0.001))]
+    high = sample[int(round((N-1)*0.999))]
+    var.atts['low'] = low
+    var.atts['high'] = high
+
+
+# Round floating-point values to the given number of significant (decimal)
+# digits, by zeroing out the unneeded bits of the mantissa.
+# The trailing zero bits make the data a lot more compressible.
+def quantize (values, digits):
+  import numpy as np
+  from math import ceil, log
+  values = np.array(values)
+  if values.dtype == np.float32: itype, mbits = np.uint32, 23
+  elif values.dtype == np.float64: itype, mbits = np.uint64, 52
+  else: return values
+  drop = mbits - int(ceil(digits*log(10,2)))
+  if drop <= 0: return values
+  bits = values.view(itype)
+  half = itype(1) << itype(drop-1)
+  mask = ~((itype(1) << itype(drop)) - itype(1))
+  finite = np.isfinite(values)
+  # Round to the nearest retained bit.
+  bits[finite] = (bits[finite] + half) & mask
+  return values
+
+# Chunk shape to use for the given access pattern:
+#   'map'        - one timestep at a time, over the whole domain
+#                  (movies, maps).
+#   'timeseries' - all timesteps at once, at a few points
+#                  (station samples, totals).
+# Returns None if there's no preference.
+def chunk_shape (var, access):
+  if access is None or not var.hasaxis('time'): return None
+  itime = var.whichaxis('time')
+  if access == 'map':
+    return [1 if i == itime else n for i,n in enumerate(var.shape)]
+  if access == 'timeseries':
+    return [n if i == itime else 1 for i,n in enumerate(var.shape)]
+  raise ValueError("Unknown access pattern '%s'"%access)
+
+# Copy a netCDF file, applying compression and chunking to the given
+# variables.
+# chunks is a dictionary of variable name -> chunk shape (or None).
+def _repack (src, dst, chunks, compress=0, shuffle=True):
+  import netCDF4
+  fin = netCDF4.Dataset(src)
+  fout = netCDF4.Dataset(dst, 'w', format='NETCDF4')
+  try:
+    fout.setncatts(dict((a,fin.getncattr(a)) for a in fin.ncattrs()))
+    for name, dim in fin.dimensions.items():
+      fout.createDimension(name, None if dim.isunlimited() else len(dim))
+    for name, v in fin.variables.items():
+      v.set_auto_maskandscale(False)
+      atts = dict((a,v.getncattr(a)) for a in v.ncattrs())
+      fill_value = atts.pop('_FillValue', None)
+      options = {}
+      if name in chunks:
+        options = dict(zlib=(compress>0), complevel=max(compress,1), shuffle=shuffle)
+        # (skip the chunking if the variable was encoded with a different shape)
+        if chunks[name] is not None and len(chunks[name]) == v.ndim:
+          options['chunksizes'] = [min(c,n) for c,n in zip(chunks[name],v.shape)]
+      out = fout.createVariable(name, v.dtype, v.dimensions, fill_value=fill_value, **options)
+      out.set_auto_maskandscale(False)
+      out.setncatts(atts)
+      if v.ndim == 0:
+        out.assignValue(v.getValue())
+      else:
+        out[...] = v[...]
+  finally:
+    fin.close()
+    fout.close()
+
+
 # Error classes related to caching
 
+# File extension for each of the cache formats.
+_extensions = {'netcdf':'.nc', 'npy':'.npy'}
+
+
 class CacheReadError (IOError): pass
 class CacheWriteError (IOError): pass
 
 
 # The Cache object:
 
+import profiler
 class Cache (object):
-  def __init__ (self, write_dir, read_dirs=[]):
+  # Storage options for the cache files:
+  #   compress - zlib compression level (0 = no compression).
+  #   shuffle - apply the shuffle filter before compressing.
+  #   significant_digits - round the values to this many significant digits
+  #                        (lossy, but compresses much better).  Cache files
+  #                        with rounded values get a separate name.
+  #   chunking - chunk the cache files for the way they're read by the
+  #              diagnostics (by map or by timeseries).
+  #   format - 'netcdf' (default), or 'npy' for raw arrays that are
+  #            memory-mapped when read (fast random access, but no
+  #            compression).
+  def __init__ (self, write_dir, read_dirs=[], compress=0, shuffle=True, significant_digits=None, chunking=False, format='netcdf'):
 
     # Set up the save/load hooks.
     from station_data import station_axis_save_hook, station_axis_load_hook
@@ -91,11 +253,76 @@ class Cache (object):
     self.read_dirs = read_dirs
     self.write_dir = write_dir
 
+    self.compress = compress
+    self.shuffle = shuffle
+    self.significant_digits = significant_digits
+    self.chunking = chunking
+
+    if format not in _extensions:
+      raise ValueError("Unknown cache format '%s'.  Expected one of: %s"%(format,', '.join(sorted(_extensions))))
+    self.format = format
+    self.extension = _extensions[format]
+
+  # Save a dataset into a cache file, with the storage options applied.
+  # The access pattern ('map' or 'timeseries') determines the chunk shape
+  # (if chunking is enabled).
+  def _save (self, filename, dataset, access=None, version=3):
+    from os import rename, remove
+    from pygeode.formats import netcdf
+    from pygeode.dataset import asdataset
+    from warnings import warn
+    if filename.endswith('.npy'):
+      import npy_cache
+      npy_cache.save(filename, dataset.vars[0])
+      return
+    # Apply any hooks for saving the var (extra metadata encoding?)
+    for save_hook in self.save_hooks:
+      dataset = asdataset(save_hook(dataset))
+    tmpfile = _tmpfile(filename)
+    netcdf.save(tmpfile, dataset, version=version)
+    if not self.chunking: access = None
+    # Only need to re-write the file if compression or chunking was asked for.
+    if self.compress > 0 or access is not None:
+      try:
+        chunks = dict((var.name,chunk_shape(var,access)) for var in dataset.vars)
+        _repack(tmpfile, tmpfile+'.repack', chunks, compress=self.compress, shuffle=self.shuffle)
+        rename(tmpfile+'.repack', tmpfile)
+      except ImportError:
+        warn ("netCDF4 module not available.  Cache files will not be compressed or chunked.", stacklevel=2)
+    rename(tmpfile, filename)
+
+  # Open a cache file, and return the variable in it.
+  def _open (self, filename):
+    from pygeode.formats import netcdf
+    from pygeode.dataset import asdataset
+    if filename.endswith('.npy'):
+      import npy_cache
+      return npy_cache.load(filename)
+    dataset = netcdf.open(filename)
+    # Apply any hooks for loading the var (extra metadata decoding?)
+    for load_hook in self.load_hooks:
+      dataset = asdataset(load_hook(dataset))
+    return dataset.vars[0]
+
+  # Convert a cache file to netCDF (e.g. to share it with someone else).
+  def export (self, filename, ncfile):
+    from pygeode.formats import netcdf
+    from pygeode.dataset import asdataset
+    from shutil import copyfile
+    if filename.endswith('.nc'):
+      copyfile(filename, ncfile)
+      return
+    dataset = asdataset([self._open(filename)])
+    for save_hook in self.save_hooks:
+      dataset = asdataset(save_hook(dataset))
+    netcdf.save(ncfile, dataset)
+
 
 
 
   # Write out the data
-  def write (self, var, prefix, suffix='', split_time=True, force_single_precision=True, _dryrun=False):
+  @profiler.timed('cache_write')
+  def write (self, var, prefix, suffix='', split_time=True, force_single_precision=True, access=None, _dryrun=False):
     from os.path import exists
     from os import remove, mkdir, rename
     from pygeode.formats import netcdf
@@ -107,81 +334,51 @@ class Cache (object):
     if var.size == 0:
       raise ValueError("No data to cache - field '%s' is empty.  Shape: %s  Prefix: %s"%(var.name,var.shape,prefix))
 
-    # Make sure the data is saved with a consistent start date
-    # (makes it easier to plot timeseries data from multiple sources)
-    var = fix_timeaxis(var)
-
-    # Apply a hash to the data's domain information
-    prefix = prefix + '_' + domain_hash(var)
-
-    # Make sure the data is in 32-bit precision
-    # (sometimes diagnostics cause a 64-bit output - waste of space)
-    if force_single_precision and (var.dtype.name != 'float32'):
-      var = var.as_type('float32')
+    var, prefix = self._prepare(var, prefix, force_single_precision)
 
     # Special case - no time axis
     if not var.hasaxis('time'):
-      filename = self.full_path(prefix + suffix + ".nc")
+      filename = self.full_path(prefix + suffix + self.extension)
       if not exists(filename):
-        filename = self.full_path(prefix + suffix + ".nc", writeable=True)
+        filename = self.full_path(prefix + suffix + self.extension, writeable=True)
         if _dryrun: return filename
-        dataset = asdataset([var])
-        for save_hook in self.save_hooks:
-          dataset = asdataset(save_hook(dataset))
-        netcdf.save(filename+".tmp", dataset)
-        rename(filename+".tmp",filename)
-      dataset = netcdf.open(filename)
-      for load_hook in self.load_hooks:
-        dataset = asdataset(load_hook(dataset))
-      var = dataset.vars[0]
-      return var
+        profiler.add_bytes('cache_write', var.size*var.dtype.itemsize)
+        self._save(filename, asdataset([var]))
+      return self._open(filename)
 
     taxis = var.getaxis('time')
 
+    # Keep rounded data separate from the full-precision data.
+    suffix = suffix + self._precision_suffix()
+
     # For the usual case, split the data into individual files for each timestep
 
     # Generate a list of filenames
-    pattern = ""
-    if 'year' in taxis.auxarrays:
-      years = ["%04d"%y for y in taxis.auxarrays['year']]
-      pattern += "$Y"
-    else:
-      years = [''] * len(taxis)
-
-    if 'month' in taxis.auxarrays:
-      months = ["%02d"%m for m in taxis.auxarrays['month']]
-      pattern += "$m"
-    else:
-      months = [''] * len(taxis)
-
-    if 'day' in taxis.auxarrays:
-      days = ["%02d"%d for d in taxis.auxarrays['day']]
-      pattern += "$d"
-    else:
-      days = [''] * len(taxis)
-
-    if 'hour' in taxis.auxarrays:
-      hours = ["%02d"%h for h in taxis.auxarrays['hour']]
-      pattern += "$H"
-    else:
-      hours = [''] * len(taxis)
-
-    if 'minute' in taxis.auxarrays:
-      minutes = ["%02d"%m for m in taxis.auxarrays['minute']]
-      pattern += "$M"
-    else:
-      minutes = [''] * len(taxis)
-
-    datestrings = [y+m+d+H+M for y,m,d,H,M in zip(years,months,days,hours,minutes)]
+    datestrings, pattern = _datestrings(taxis)
     first_date = datestrings[0]
     last_date = datestrings[-1]
 
     # Check if we already have the data in the cache
     # (look for the one big file that gets generated in the last stage)
-    bigfile = self.full_path(prefix+suffix+"_"+datestrings[0]+"-"+datestrings[-1]+".nc")
+    bigfile = self.full_path(prefix+suffix+"_"+datestrings[0]+"-"+datestrings[-1]+self.extension)
+
+    # Check if the data can be taken from a cache file that covers a longer
+    # period (or more hours of the day).
+    if not exists(bigfile):
+      superset = self._find_superset(var, prefix, suffix)
+      if superset is not None:
+        filename, var = superset
+        if _dryrun: return filename
+        # The ranges stored in the file are for the whole period, so
+        # re-compute them for this subset.
+        var = var.load()
+        var.atts = dict(var.atts)
+        _set_ranges(var)
+        return var.replace_axes(time=taxis)
+
     if not exists(bigfile):
 
-      bigfile = self.full_path(prefix+suffix+"_"+datestrings[0]+"-"+datestrings[-1]+".nc", writeable=True)
+      bigfile = self.full_path(prefix+suffix+"_"+datestrings[0]+"-"+datestrings[-1]+self.extension, writeable=True)
       if _dryrun: return bigfile
 
       # Split into 1 file per timestep?
@@ -193,17 +390,7 @@ class Cache (object):
         pbar = PBar (message = "Caching %s"%prefix+suffix)
         for i, datestring in enumerate(datestrings):
           pbar.update(i*100./len(datestrings))
-
-          filename = self.full_path(prefix+"_split/"+prefix+"_"+datestring+".nc")
-          if exists(filename): continue
-          filename = self.full_path(prefix+"_split/"+prefix+"_"+datestring+".nc", writeable=True)
-
-          # Save the data
-          data = asdataset([var(i_time=i)])
-          for save_hook in self.save_hooks:
-            data = asdataset(save_hook(data))
-          netcdf.save(filename+".tmp", data)
-          rename(filename+".tmp",filename)
+          self._write_split(var, prefix, i, datestring)
 
         pbar.update(100)
 
@@ -225,40 +412,22 @@ class Cache (object):
       # Load into memory
       var = var.load()
 
+      # Reduce the precision?
+      if self.significant_digits is not None:
+        from pygeode.var import Var
+        var = Var(var.axes, values=quantize(var.values, self.significant_digits), name=var.name, atts=dict(var.atts))
+
       # Compute ranges for the data
-      try:
-        var.atts['low'] = np.nanpercentile(var.values, 0.1)
-        var.atts['high'] = np.nanpercentile(var.values, 99.9)
-      # Fall back for older versions of numpy.
-      except AttributeError:
-        sample = var.values.flatten()
-        # Filter out NaN values
-        sample = sample[np.isfinite(sample)]
-        # Get a good range (covers most values)
-        sample.sort()
-        N = len(sample)
-        low = sample[int(round((N-1)*0.001))]
-        high = sample[int(round((N-1)*0.999))]
-        var.atts['low'] = low
-        var.atts['high'] = high
-
-      # Apply any hooks for saving the var (extra metadata encoding?)
-      dataset = asdataset([var])
-      for save_hook in self.save_hooks:
-        dataset = asdataset(save_hook(dataset))
+      _set_ranges(var)
+
       # Re-save back to a big file
-      netcdf.save (bigfile+".tmp", dataset, version=4)
-      rename(bigfile+".tmp",bigfile)
+      profiler.add_bytes('cache_write', var.values.nbytes)
+      self._save(bigfile, asdataset([var]), access=access, version=4)
 
     # (end of cache file creation)
 
     # Load the data from the big file
-    dataset = netcdf.open(bigfile)
-
-    # Apply any hooks for loading the var (extra metadata decoding?)
-    for load_hook in self.load_hooks:
-      dataset = asdataset(load_hook(dataset))
-    var = dataset.vars[0]
+    var = self._open(bigfile)
 
     # Force the time axis (we lose information about whether this was a monthly
     # mean, etc. once we write into netcdf).
@@ -266,6 +435,163 @@ class Cache (object):
 
     return var
 
+  # Normalize the data before writing it into the cache.
+  # Returns the modified variable, and the prefix with the domain hash added.
+  def _prepare (self, var, prefix, force_single_precision=True):
+    from common import fix_timeaxis
+
+    # Make sure the data is saved with a consistent start date
+    # (makes it easier to plot timeseries data from multiple sources)
+    var = fix_timeaxis(var)
+
+    # Apply a hash to the data's domain information
+    prefix = prefix + '_' + domain_hash(var)
+
+    # Make sure the data is in 32-bit precision
+    # (sometimes diagnostics cause a 64-bit output - waste of space)
+    if force_single_precision and (var.dtype.name != 'float32'):
+      var = var.as_type('float32')
+
+    return var, prefix
+
+  # Extra suffix for the cache files, to identify data that was rounded to
+  # fewer significant digits.
+  def _precision_suffix (self):
+    if self.significant_digits is None: return ''
+    return '_%dsd'%self.significant_digits
+
+  # Look for an existing cache file that contains all the timesteps of the
+  # given variable.  It must have the same prefix (and domain hash), and the
+  # suffix can only differ in the time filters that were applied
+  # (date range, hour0-only, particular hour).
+  # Returns the filename and the matching subset of the data (not loaded yet),
+  # or None if no such file was found.
+  def _find_superset (self, var, prefix, suffix):
+    from os.path import join, basename
+    from glob import glob
+    from common import fix_timeaxis
+    import numpy as np
+
+    wanted = _non_time_filters(suffix)
+    times = var.getaxis('time').values
+    datestrings, pattern = _datestrings(var.getaxis('time'))
+    first, last = min(datestrings), max(datestrings)
+
+    dirs = []
+    if self.write_dir is not None:
+      dirs.append(self.write_dir)
+    dirs.extend(self.read_dirs)
+
+    for dirname in dirs:
+      for filename in sorted(glob(join(dirname,prefix+"*"+self.extension))):
+        # Strip off the prefix, and the date range of the file, to get the
+        # suffix.
+        parts = basename(filename)[len(prefix):-len(self.extension)].rsplit('_',1)
+        if len(parts) != 2: continue
+        other_suffix, daterange = parts
+        if _non_time_filters(other_suffix) != wanted: continue
+        # Only open the files whose date range covers the requested times.
+        daterange = daterange.split('-')
+        if len(daterange) != 2 or len(daterange[0]) != len(first) or len(daterange[1]) != len(last): continue
+        if daterange[0] > first or daterange[1] < last: continue
+        try:
+          other = self._open(filename)
+        except Exception:
+          continue  # Unreadable file?
+        if other.name != var.name: continue
+        other = fix_timeaxis(other)
+        if not other.hasaxis('time'): continue
+        # Check that all the timesteps are available.
+        other_times = other.getaxis('time').values
+        order = np.argsort(other_times)
+        ind = np.searchsorted(other_times, times, sorter=order)
+        ind = order[np.minimum(ind, len(order)-1)]
+        if not np.all(np.abs(other_times[ind]-times) < 1E-5): continue
+        return filename, other(l_time=list(other_times[ind]))
+
+    return None
+
+  # Save a single timestep of the data into its own file.
+  def _write_split (self, var, prefix, i, datestring):
+    from os.path import exists
+    from os import rename
+    from pygeode.formats import netcdf
+    from pygeode.dataset import asdataset
+
+    filename = self.full_path(prefix+"_split/"+prefix+"_"+datestring+".nc")
+    if exists(filename): return
+    filename = self.full_path(prefix+"_split/"+prefix+"_"+datestring+".nc", writeable=True)
+
+    # Save the data
+    data = asdataset([var(i_time=i)])
+    for save_hook in self.save_hooks:
+      data = asdataset(save_hook(data))
+    profiler.add_bytes('cache_write', sum(v.size*v.dtype.itemsize for v in data.vars))
+    tmpfile = _tmpfile(filename)
+    netcdf.save(tmpfile, data)
+    rename(tmpfile,filename)
+
+  # Write several variables into the cache together.
+  # The timesteps are saved in chronological order, with all the variables
+  # for a timestep written before moving on to the next one.  Useful when the
+  # variables are derived from the same source data (the source is only read
+  # once for each timestep).
+  # Variables that aren't split in time (split_time=False) are computed in the
+  # same pass, and kept in memory until they're saved at the end.
+  # Input: a list of (var, kwargs) pairs, where kwargs are the arguments to
+  # pass to write().
+  # Returns the list of cached variables.
+  @profiler.timed('cache_write')
+  def write_many (self, requests):
+    from os.path import exists
+    from pygeode.progress import PBar
+    from pygeode.var import Var
+    import numpy as np
+
+    # Find the fields that still need to be computed.
+    pending = []
+    for n, (var, kwargs) in enumerate(requests):
+      if not var.hasaxis('time'): continue
+      if var.size == 0: continue
+      var, prefix = self._prepare(var, kwargs['prefix'], kwargs.get('force_single_precision',True))
+      datestrings, pattern = _datestrings(var.getaxis('time'))
+      suffix = kwargs.get('suffix','') + self._precision_suffix()
+      bigfile = self.full_path(prefix+suffix+"_"+datestrings[0]+"-"+datestrings[-1]+self.extension)
+      if exists(bigfile): continue
+      if self._find_superset(var, prefix, suffix) is not None: continue
+      # Where to put the data for fields that aren't split in time.
+      if kwargs.get('split_time',True):
+        values = None
+      else:
+        values = np.empty(var.shape, dtype=var.dtype)
+      pending.append((n, var, prefix, dict((d,i) for i,d in enumerate(datestrings)), values))
+
+    # Write the timesteps of all the fields in lock-step.
+    if len(pending) > 0:
+      all_dates = sorted(set(d for n,var,prefix,dates,values in pending for d in dates))
+      pbar = PBar (message = "Caching %d fields together"%len(pending))
+      for i, datestring in enumerate(all_dates):
+        pbar.update(i*100./len(all_dates))
+        for n, var, prefix, dates, values in pending:
+          if datestring not in dates: continue
+          if values is None:
+            self._write_split(var, prefix, dates[datestring], datestring)
+          else:
+            itime = var.whichaxis('time')
+            ind = (slice(None),)*itime + (dates[datestring],)
+            values[ind] = var(i_time=dates[datestring]).get().reshape(values[ind].shape)
+      pbar.update(100)
+
+    # Use the computed values for the fields that aren't split in time.
+    requests = list(requests)
+    for n, var, prefix, dates, values in pending:
+      if values is None: continue
+      orig, kwargs = requests[n]
+      requests[n] = (Var(var.axes, values=values, name=orig.name, atts=orig.atts), kwargs)
+
+    # Assemble the final cache files.
+    return [self.write(var, **kwargs) for var, kwargs in requests]
+
   # Give the name of the cache file that would be created when write() is called
   def where_write (self, *args, **kwargs):
     kwargs['_dryrun'] = True
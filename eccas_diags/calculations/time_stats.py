@@ -24,28 +24,22 @@ from . import quick_calc
 # Helper method:
 # Select months that have full data coverage
 def full_months(var):
-  from datetime import datetime, timedelta
+  import numpy as np
   from pygeode.timeutils import delta
-  from ..common import to_datetimes
-  dates = to_datetimes(var.time)
-  dt = delta(var.time)
-  dt = timedelta(**{var.time.units:dt})
+  from ..common import to_datetime64, to_timedelta64
+  dates = to_datetime64(var.time)
+  dt = to_timedelta64(delta(var.time), var.time.units)
+  months = dates.astype('datetime64[M]')
   # Figure out which months start and the beginning and finish at the end
-  have_month_start = dict()
-  have_month_end = dict()
-  for date in dates:
-    ym = date.year, date.month
-    # For month beginning, allow for a lack of 0-hour data
-    if (date-2*dt).month != date.month:
-      have_month_start[ym] = True
-    if (date+dt).month != date.month:
-      have_month_end[ym] = True
+  # For month beginning, allow for a lack of 0-hour data
+  month_start = (dates-2*dt).astype('datetime64[M]') != months
+  month_end = (dates+dt).astype('datetime64[M]') != months
+  unique_months, imonth = np.unique(months, return_inverse=True)
+  have_month_start = np.bincount(imonth, weights=month_start, minlength=len(unique_months)) > 0
+  have_month_end = np.bincount(imonth, weights=month_end, minlength=len(unique_months)) > 0
   # Collect all the time indices that are in a full month
-  time_indices = []
-  for i,date in enumerate(dates):
-    ym = date.year, date.month
-    if have_month_start.get(ym,False) and have_month_end.get(ym,False):
-      time_indices.append(i)
+  full = (have_month_start & have_month_end)[imonth]
+  time_indices = list(np.where(full)[0])
   return var.slice[time_indices,...]
 
 
@@ -39,7 +39,7 @@ def zonalmean (dataset):
 
 @quick_calc
 def zonalstdev (dataset):
-  from ..common import remove_repeated_longitude
+  from ..common import remove_repeated_longitude, nanstats
 
   for invar in dataset:
     if not invar.hasaxis('lon'):
@@ -49,7 +49,10 @@ def zonalstdev (dataset):
     # Remove any repeated longtiude (for global data)
     invar = remove_repeated_longitude(invar)
 
-    # Do the standard deviation (NOTE: single-pass algorithm, may lose precision)
-    yield invar.nanstdev('lon')
+    # Do the standard deviation
+    # (single pass over the data, using Welford's algorithm for precision)
+    outvar, = nanstats(invar, 'lon', ['stdev'])
+    outvar.name = invar.name
+    yield outvar
 
 
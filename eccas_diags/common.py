@@ -142,13 +142,19 @@ def _what_extra_fields (data, fieldname, units, table):
     except ValueError: pass
   raise ValueError (errmsg)
 
-# Helper method - find the field in the dataset, and apply some unit conversion.
+# Helper method - work out how to get the given field(s) in the given units
+# from a product, without doing any of the actual conversions.
 # Handle some extra logic, such as going between dry and moist air.
-def find_and_convert (product, fieldnames, units, **conditions):
+# Returns a ConversionPlan, which can be applied to get the converted fields.
+# Raises KeyError if a field isn't available, or ValueError if it can't be
+# converted to the requested units.
+# The plan is remembered by the product, so asking again (e.g. when a
+# diagnostic checks if a product is usable, then does the real computation)
+# doesn't repeat the search.
+def conversion_plan (product, fieldnames, units, **conditions):
   from pygeode.dataset import Dataset
   from pygeode.var import Var
   from eccas_diags.interfaces import DataInterface
-  from units import copy_default_table, define_conversion, parse_units, simplify, inverse
 
   # Allow a list of variables to be passed in.
   if isinstance(product,list) and isinstance(product[0],Var):
@@ -158,92 +164,133 @@ def find_and_convert (product, fieldnames, units, **conditions):
   if isinstance(product,Dataset):
     product = DataInterface([product])
 
-  return_list = True
-
   if isinstance(fieldnames,str):
     fieldnames = [fieldnames]
-    return_list = False
   if isinstance(units,str): units = [units]*len(fieldnames)
 
-  # Create a separate unit table for each variable, to handle things like
-  # semi-dry air uniquely.
-  tables = [copy_default_table() for fieldname in fieldnames]
-
-  # Test table, with no entry for dry air.
-  # So we can partially reduce the units without going from moles to mass.
-  test_table = copy_default_table()
-  del test_table['mol'].conversions['dry_air']
-
-  # Convert semi-dry air based on the type of output units
-  for fieldname, out_units, table in zip(fieldnames, units, tables):
-    in_units = product.find_best(fieldname).atts.get('units','')
-    in_units = simplify(in_units,table=test_table)
-    # Allow the user to skip unit conversion by setting output units to None
-    if out_units is None: continue
-    out_units = simplify(out_units,table=test_table)
-    all_units = in_units.split() + out_units.split()
-    # If looking at molefractions, treat as dry air.
-    if 'mol(semidry_air)-1' in all_units and 'mol(dry_air)-1' in all_units:
-      define_conversion ('mol(semidry_air)', 'mol(dry_air)', table=table)
-    # If converting molefractions to mass, then treat as dry air for the
-    # purpose of getting mass, then redefine it as moist air afterwards.
-    elif 'mol(semidry_air)-1' in all_units and 'g(air)-1' in all_units:
-      define_conversion ('mol(semidry_air)', 'mol(dry_air) g(dry_air)-1 g(air)', table=table)
-    # If looking at mass, then treat as moist air.
-    elif 'g(semidry_air)-1' in all_units and 'g(air)-1' in all_units:
-      define_conversion ('g(semidry_air)', 'g(air)', table=table)
-    # If converting mass to mixing ratio, then treat as dry air.
-    elif 'g(semidry_air)-1' in all_units and 'mol(dry_air)-1' in all_units:
-      define_conversion ('g(semidry_air)', 'g(dry_air)', table=table)
-
-  # Find out what extra fields are needed for the conversions
-  extra_fields = []
-  exponents = []  # +1 = multiply, -1 = divide
-  for fieldname, unit, table in zip(fieldnames,units,tables):
-    # Allow the user to skip unit conversion by setting output units to None
-    if unit is None: continue
-    f, exp = _what_extra_fields(product, fieldname, unit, table=table)
-    extra_fields.extend(f)
-    exponents.extend(exp)
-
-  # Reduce to a unique set of extra fields
-  if len(extra_fields) > 0:
-    extra_fields, exponents = zip(*set(zip(extra_fields,exponents)))
-
-  # Get all fields (original and extra)
-  vars = product.find_best(list(fieldnames)+list(extra_fields), **conditions)
-
-  # Split into the two categories
-  vars, extra_vars = vars[:len(fieldnames)], vars[len(fieldnames):]
-
-  # Apply the extra fields
-  for i,fieldname in enumerate(fieldnames):
-    # Allow the user to skip unit conversion by setting output units to None
-    if units[i] is None: continue
-    F, exp = _what_extra_fields(product, fieldname, units[i], table=tables[i])
-    extra = [extra_vars[extra_fields.index(f)] for f in F]
-    for v, e in zip(extra,exp):
-      unit = vars[i].atts['units']
-      specie = vars[i].atts.get('specie',None)
-      assert e in (1,-1), "Unhandled exponent %d"%e
-      if e == 1:
-        vars[i] *= v
-        vars[i].atts['units'] = unit + ' ' + v.atts['units']
-      elif e == -1:
-        vars[i] /= v
-        vars[i].atts['units'] = unit + ' ' + inverse(v.atts['units'])
-      vars[i].name = fieldname
-      if specie is not None:
-        vars[i].atts['specie'] = specie
-
-  # Do any remaining unit conversions.
-  # Skip conversions when output unit set to None.
-  vars = [convert(v, unit, table=table) if unit is not None else v for v,unit,table in zip(vars,units,tables)]
-
-  if return_list:
-    return vars
-  else:
+  # Re-use the plan from an identical query.
+  plans = getattr(product,'_plans',None)
+  try:
+    key = (tuple(fieldnames), tuple(units), tuple(sorted(conditions.items())))
+    plan = plans.get(key) if plans is not None else None
+  except TypeError:  # Unhashable criteria?
+    key = None
+    plan = None
+  if plan is not None:
+    if isinstance(plan,Exception): raise plan
+    return plan
+
+  try:
+    plan = ConversionPlan(product, fieldnames, units, **conditions)
+  except (KeyError, ValueError) as e:
+    if plans is not None and key is not None: plans[key] = e
+    raise
+
+  if plans is not None and key is not None: plans[key] = plan
+  return plan
+
+class ConversionPlan (object):
+  """
+  The source fields (and extra fields) needed to get some fields in the
+  requested units.  Use apply() to get the converted fields.
+  """
+  def __init__ (self, product, fieldnames, units, **conditions):
+    from units import copy_default_table, define_conversion, simplify
+
+    self.fieldnames = fieldnames = list(fieldnames)
+    self.units = units = list(units)
+
+    # Create a separate unit table for each variable, to handle things like
+    # semi-dry air uniquely.
+    self.tables = tables = [copy_default_table() for fieldname in fieldnames]
+
+    # Test table, with no entry for dry air.
+    # So we can partially reduce the units without going from moles to mass.
+    test_table = copy_default_table()
+    del test_table['mol'].conversions['dry_air']
+
+    # Convert semi-dry air based on the type of output units
+    for fieldname, out_units, table in zip(fieldnames, units, tables):
+      in_units = product.find_best(fieldname).atts.get('units','')
+      in_units = simplify(in_units,table=test_table)
+      # Allow the user to skip unit conversion by setting output units to None
+      if out_units is None: continue
+      out_units = simplify(out_units,table=test_table)
+      all_units = in_units.split() + out_units.split()
+      # If looking at molefractions, treat as dry air.
+      if 'mol(semidry_air)-1' in all_units and 'mol(dry_air)-1' in all_units:
+        define_conversion ('mol(semidry_air)', 'mol(dry_air)', table=table)
+      # If converting molefractions to mass, then treat as dry air for the
+      # purpose of getting mass, then redefine it as moist air afterwards.
+      elif 'mol(semidry_air)-1' in all_units and 'g(air)-1' in all_units:
+        define_conversion ('mol(semidry_air)', 'mol(dry_air) g(dry_air)-1 g(air)', table=table)
+      # If looking at mass, then treat as moist air.
+      elif 'g(semidry_air)-1' in all_units and 'g(air)-1' in all_units:
+        define_conversion ('g(semidry_air)', 'g(air)', table=table)
+      # If converting mass to mixing ratio, then treat as dry air.
+      elif 'g(semidry_air)-1' in all_units and 'mol(dry_air)-1' in all_units:
+        define_conversion ('g(semidry_air)', 'g(dry_air)', table=table)
+
+    # Find out what extra fields are needed for the conversions
+    per_field = []
+    extra_fields = []
+    exponents = []  # +1 = multiply, -1 = divide
+    for fieldname, unit, table in zip(fieldnames,units,tables):
+      # Allow the user to skip unit conversion by setting output units to None
+      if unit is None:
+        per_field.append(([],[]))
+        continue
+      f, exp = _what_extra_fields(product, fieldname, unit, table=table)
+      per_field.append((f,exp))
+      extra_fields.extend(f)
+      exponents.extend(exp)
+
+    # Reduce to a unique set of extra fields
+    if len(extra_fields) > 0:
+      extra_fields, exponents = zip(*set(zip(extra_fields,exponents)))
+
+    # Get all fields (original and extra)
+    vars = product.find_best(list(fieldnames)+list(extra_fields), **conditions)
+
+    # Split into the two categories
+    self.vars, extra_vars = vars[:len(fieldnames)], vars[len(fieldnames):]
+
+    # The extra fields to apply to each variable (with exponents).
+    self.extra = [[(extra_vars[extra_fields.index(f)],e) for f,e in zip(F,exp)] for F,exp in per_field]
+
+  # Do the conversions.
+  # Returns a list of the converted fields.
+  def apply (self):
+    from units import inverse
+    vars = list(self.vars)
+    # Apply the extra fields
+    for i,fieldname in enumerate(self.fieldnames):
+      for v, e in self.extra[i]:
+        unit = vars[i].atts['units']
+        specie = vars[i].atts.get('specie',None)
+        assert e in (1,-1), "Unhandled exponent %d"%e
+        if e == 1:
+          vars[i] *= v
+          vars[i].atts['units'] = unit + ' ' + v.atts['units']
+        elif e == -1:
+          vars[i] /= v
+          vars[i].atts['units'] = unit + ' ' + inverse(v.atts['units'])
+        vars[i].name = fieldname
+        if specie is not None:
+          vars[i].atts['specie'] = specie
+
+    # Do any remaining unit conversions.
+    # Skip conversions when output unit set to None.
+    return [convert(v, unit, table=table) if unit is not None else v for v,unit,table in zip(vars,self.units,self.tables)]
+
+# Helper method - find the field in the dataset, and apply some unit conversion.
+# Handle some extra logic, such as going between dry and moist air.
+def find_and_convert (product, fieldnames, units, **conditions):
+  vars = conversion_plan(product, fieldnames, units, **conditions).apply()
+  if isinstance(fieldnames,str):
     return vars[0]
+  else:
+    return vars
 
 
 grav = .980616e+1  # Taken from GEM-MACH file chm_consphychm_mod.ftn90
@@ -280,14 +327,22 @@ def best_type (x):
   except ValueError:pass
   return x
 
+# Convert the strings from a JSON file back to regular (non-unicode) strings,
+# since some of the diagnostics check for str.
+def strip_unicode (obj):
+  if isinstance(obj,unicode): return str(obj)
+  if isinstance(obj,list): return map(strip_unicode, obj)
+  if isinstance(obj,dict): return dict((strip_unicode(k),strip_unicode(v)) for k,v in obj.iteritems())
+  return obj
+
 # Find overlapping time axis between two variables
 def same_times (*varlist):
+  import numpy as np
   # Use the same start date (so relative values are comparable)
   varlist = map(fix_timeaxis,varlist)
   # Get a common set of time values
-  times = [set(var.time.values) for var in varlist]
-  times = reduce(set.intersection,times,times[0])
-  times = sorted(times)
+  times = reduce(np.intersect1d, [var.time.values for var in varlist])
+  times = list(times)
   if len(times) == 0:
     raise ValueError ("No overlapping timesteps found for %s"%(",".join(v.name for v in varlist)))
   return [var(l_time=times) for var in varlist]
@@ -303,24 +358,38 @@ def first_timestep (var):
     var = var.squeeze('forecast')
   return var
 
+# Length of the time units (in microseconds)
+_time_units = dict(weeks=604800e6, days=86400e6, hours=3600e6, minutes=60e6, seconds=1e6, milliseconds=1e3, microseconds=1.)
+
+# Convert time values (in the given units) to an array of timedelta64 values.
+def to_timedelta64(values, units):
+  import numpy as np
+  values = np.asarray(values, dtype='float64') * _time_units[units]
+  return np.round(values).astype('int64').astype('timedelta64[us]')
+
+# Convert a time axis to an array of datetime64 values.
+def to_datetime64(taxis):
+  import numpy as np
+  from datetime import datetime
+  ref = np.datetime64(datetime(**taxis.startdate), 'us')
+  return ref + to_timedelta64(taxis.values, taxis.units)
+
 # Convert a time axis to a list of datetime objects.
 def to_datetimes(taxis):
-  from datetime import datetime,timedelta
-  ref = datetime(**taxis.startdate)
-  units = taxis.units
-  values = taxis.values
-  return [ref+timedelta(**{units:v}) for v in values]
+  return list(to_datetime64(taxis).astype(object))
 
 # Detect regularly-spaced data, and "fill in" the gaps with NaN values.
 # Note: loads ALL the data into memory, so use with caution.
 def detect_gaps(var):
   import numpy as np
-  from collections import Counter
   from pygeode.var import Var, copy_meta
   # If no time values, do nothing.
   if len(var.time) <= 1: return var
 
-  dt, count = Counter(np.diff(var.time.values)).most_common(1)[0]
+  # (Note: return_counts isn't available in older versions of numpy).
+  diffs, inverse = np.unique(np.diff(var.time.values), return_inverse=True)
+  counts = np.bincount(inverse)
+  dt, count = diffs[np.argmax(counts)], np.max(counts)
   # If we have an extremely irregular time axis, then don't try to make it
   # regular (e.g. for flask data, which is taken whenever they remember to
   # do it?)
@@ -338,6 +407,32 @@ def detect_gaps(var):
   copy_meta (var, outvar)
   return outvar
 
+# Compute NaN-aware statistics over groups of data, in a single pass.
+# Inputs:
+#   group: integer group index (0..ngroups-1) for each data value.
+#   data: the data values (same shape as group).
+#   ngroups: total number of groups.
+# Returns the number of finite values, the mean, and the standard deviation
+# (with n-1 degrees of freedom) for each group.
+# Groups with not enough valid data get NaN for the mean / standard deviation.
+def grouped_mean_stddev (group, data, ngroups):
+  import numpy as np
+  group = np.asarray(group).reshape(-1)
+  data = np.asarray(data, dtype='float64').reshape(-1)
+  valid = np.isfinite(data)
+  group = group[valid]
+  data = data[valid]
+  count = np.bincount(group, minlength=ngroups)
+  total = np.bincount(group, weights=data, minlength=ngroups)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    mean = total / count
+    # Use the deviations from the mean, for better precision.
+    sqdev = np.bincount(group, weights=(data-mean[group])**2, minlength=ngroups)
+    stddev = np.sqrt(sqdev / (count-1))
+  mean[count==0] = float('nan')
+  stddev[count<=1] = float('nan')
+  return count, mean, stddev
+
 # Adjust a lat/lon grid from -180,180 to 0,360
 def rotate_grid (data):
   from pygeode.axis import Lon
@@ -627,24 +722,23 @@ class SquashForecasts(Var):
   def getview (self, view, pbar):
     import numpy as np
     out = np.empty(view.shape, dtype=self.dtype)
-    nt = len(self._var.time)
     nf = len(self._var.forecast)
     v = view.map_to(self._var, strict=False)
-    tslice = list(view.integer_indices[0]//nf)
-    fslice = list(view.integer_indices[0]%nf)
-    # Collect forecasts from the same origin date together
-    # (can read them all at once)
-    tf_pairs = []
-    for i,(t,f) in enumerate(zip(tslice,fslice)):
-      if len(tf_pairs) > 0 and t == tf_pairs[-1][1]:
-        tf_pairs[-1][0].append(i)
-        tf_pairs[-1][2].append(f)
-      else: tf_pairs.append(([i],t,[f]))
-
-    for i,t,f in tf_pairs:
-      data = v.modify_slice(0,[t]).modify_slice(1,f).get(self._var)
-      out[i,...] = data.reshape(data.shape[1:])
-    pbar.update(100)
+    # Map the validity indices to (origin, forecast) index arrays.
+    tind = np.asarray(view.integer_indices[0]) // nf
+    find = np.asarray(view.integer_indices[0]) % nf
+    # Coalesce the requests into contiguous blocks of origin dates
+    # (can read each block all at once).
+    breaks = np.where((np.diff(tind) < 0) | (np.diff(tind) > 1))[0] + 1
+    blocks = np.split(np.arange(len(tind)), breaks)
+    for n, i in enumerate(blocks):
+      if len(i) == 0: continue
+      t0 = tind[i[0]]
+      t1 = tind[i[-1]]
+      forecasts = np.unique(find[i])
+      data = v.modify_slice(0,range(t0,t1+1)).modify_slice(1,list(forecasts)).get(self._var)
+      out[i,...] = data[tind[i]-t0, np.searchsorted(forecasts,find[i]),...]
+      pbar.update(100*(n+1)/len(blocks))
     return out
 
 del Var
@@ -657,6 +751,46 @@ def squash_forecasts(var):
   assert isinstance(var,Var), "Unhandled case '%s'"%type(var)
   return SquashForecasts(var)
 
+# Wrapper for a variable that remembers the data it read for the current
+# timestep.  Lets several calculations on the same timestep share a single
+# read of the source data.
+# When a single timestep is requested, the whole timestep is read, so requests
+# for different parts of the domain (levels, stations, ...) can share it too.
+from pygeode.var import Var
+class TimestepMemo(Var):
+  def __init__ (self, var):
+    from pygeode.var import Var, copy_meta
+    Var.__init__(self, var.axes, dtype=var.dtype)
+    copy_meta(var, self)
+    self._var = var
+    self._time = None
+    self._blocks = {}
+  def getview (self, view, pbar):
+    import numpy as np
+    time = None
+    if self.hasaxis('time'):
+      itime = self.whichaxis('time')
+      time = tuple(view.integer_indices[itime])
+    # Forget about the data from other timesteps.
+    if time != self._time:
+      self._blocks = {}
+      self._time = time
+    if time is not None and len(time) == 1 and self.naxes > 1:
+      if 'all' not in self._blocks:
+        full = view
+        for i in range(self.naxes):
+          if i != itime: full = full.modify_slice(i, range(len(self.axes[i])))
+        self._blocks['all'] = full.get(self._var)
+      ind = [view.integer_indices[i] if i != itime else [0] for i in range(self.naxes)]
+      pbar.update(100)
+      return self._blocks['all'][np.ix_(*ind)]
+    key = tuple(tuple(ind) for ind in view.integer_indices)
+    if key not in self._blocks:
+      self._blocks[key] = view.get(self._var)
+    pbar.update(100)
+    return self._blocks[key]
+del Var
+
 
 # Make a field positive (remove negative values)
 from pygeode.var import Var
@@ -676,6 +810,90 @@ del Var
 
 def positive(var): return Positive(var)
 
+# Single-pass NaN-aware statistics along an axis of an array.
+# The axis is processed in chunks, and the partial results are combined with
+# the parallel form of Welford's algorithm (Chan et al.), so the data is only
+# traversed once without losing precision.
+# Returns a dictionary of count, mean, var (with n-1 degrees of freedom),
+# stdev, min and max.
+def nan_moments (data, axis, chunk=64):
+  import numpy as np
+  data = np.asarray(data)
+  shape = data.shape[:axis] + data.shape[axis+1:]
+  count = np.zeros(shape, dtype='float64')
+  mean = np.zeros(shape, dtype='float64')
+  m2 = np.zeros(shape, dtype='float64')
+  vmin = np.empty(shape, dtype='float64'); vmin[()] = np.inf
+  vmax = np.empty(shape, dtype='float64'); vmax[()] = -np.inf
+  for start in range(0, data.shape[axis], chunk):
+    x = np.take(data, range(start,min(start+chunk,data.shape[axis])), axis=axis).astype('float64')
+    valid = np.isfinite(x)
+    x[~valid] = 0
+    n = valid.sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      m = x.sum(axis=axis) / n
+      m[n==0] = 0
+      dev = np.where(valid, x-np.expand_dims(m,axis), 0)
+      s = (dev**2).sum(axis=axis)
+      total = count + n
+      delta = m - mean
+      mean += np.where(total>0, delta*n/total, 0)
+      m2 += s + np.where(total>0, delta**2*count*n/total, 0)
+    count = total
+    vmin = np.minimum(vmin, np.where(valid, x, np.inf).min(axis=axis))
+    vmax = np.maximum(vmax, np.where(valid, x, -np.inf).max(axis=axis))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    var = m2 / (count-1)
+  mean[count==0] = float('nan')
+  var[count<=1] = float('nan')
+  vmin[count==0] = float('nan')
+  vmax[count==0] = float('nan')
+  return dict(count=count, mean=mean, var=var, stdev=np.sqrt(var), min=vmin, max=vmax)
+
+# Fused reduction of a variable along an axis.
+# Computes all the statistics for a block of data in one read of the source,
+# and keeps the most recent block so that other statistics of the same
+# reduction (e.g. mean and stdev) can be served without re-reading.
+class _NanStats(object):
+  def __init__ (self, var, iaxis):
+    self.var = var
+    self.iaxis = iaxis
+    self._key = None
+    self._stats = None
+  def get (self, view, pbar):
+    key = tuple(tuple(ind) for ind in view.integer_indices)
+    if key != self._key:
+      data = view.map_to(self.var, strict=False).get(self.var, pbar=pbar)
+      self._stats = nan_moments(data, self.iaxis)
+      self._key = key
+    return self._stats
+
+from pygeode.var import Var
+class NanStat(Var):
+  def __init__ (self, source, stat):
+    from pygeode.var import Var, copy_meta
+    var = source.var
+    axes = [a for i,a in enumerate(var.axes) if i != source.iaxis]
+    dtype = 'float64' if stat == 'count' else var.dtype
+    Var.__init__(self, axes, dtype=dtype)
+    copy_meta(var, self)
+    self._source = source
+    self._stat = stat
+  def getview (self, view, pbar):
+    import numpy as np
+    out = self._source.get(view, pbar)[self._stat]
+    pbar.update(100)
+    return np.asarray(out, dtype=self.dtype)
+del Var
+
+# NaN-aware count / mean / var / stdev / min / max of a variable along the
+# given axis, all computed from a single read of the data.
+# Returns a list of variables, one for each requested statistic.
+def nanstats (var, axis, stats=('mean','stdev')):
+  iaxis = var.whichaxis(axis)
+  source = _NanStats(var, iaxis)
+  return [NanStat(source, stat) for stat in stats]
+
 
 # Get a keyword / value that can be used to select a surface level for the
 # givem vertical axis.
@@ -59,7 +59,7 @@ if True:
     data = remove_repeated_longitude(data)
 
     # Cache the data (mainly to get the high/low stats)
-    data = model.cache.write(data, prefix=model.name+'_'+fieldname+suffix, suffix=end_suffix)
+    data = model.cache.write(data, prefix=model.name+'_'+fieldname+suffix, suffix=end_suffix, access='map')
 
     return data
 
@@ -46,7 +46,7 @@ class ZonalMeanBG(ZonalMean):
 
     movie = BG_Movie (fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio=1.4)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 
 from .movie import TiledMovie
@@ -73,11 +73,13 @@ class Diagnostic(object):
 
   # Apply the diagnostic to all valid input combos.
   def do_all (self, inputs):
+    from .. import profiler
     inputs = self._select_inputs(inputs)
     for current_inputs in self._input_combos(inputs):
       current_inputs = self._transform_inputs(current_inputs)
       if len(current_inputs) == 0: continue
-      self.do(current_inputs)
+      with profiler.timer('do'):
+        self.do(current_inputs)
 
   # The actual diagnostic to run.
   # Needs to be implemented for each diagnostic class.
@@ -90,6 +92,18 @@ class Diagnostic(object):
   # Additional suffix to append to summary files (e.g. movies, plots).
   end_suffix = ""
 
+  # Set this to True if the input stage of the diagnostic (selecting,
+  # combining and transforming the inputs) doesn't read any data, other than
+  # through the cache.  Such diagnostics can have their cache files filled
+  # in together with other diagnostics (see shared_reads.py).
+  shared_reads = False
+
+  # How the cached data will be read by the diagnostic.
+  # Used for picking the layout of the cache files.
+  #   'map'        - one timestep at a time, over the whole domain.
+  #   'timeseries' - all timesteps at once, at a few points.
+  cache_access = None
+
 # Diagnostics that deal with static figures (no movies).
 # Provides command-line arguments for controlling image output.
 class ImageDiagnostic(Diagnostic):
@@ -104,6 +118,26 @@ class ImageDiagnostic(Diagnostic):
     super(ImageDiagnostic,self).__init__(**kwargs)
     self.image_format = image_format
 
+# Diagnostics that produce movies.
+# Provides command-line arguments for controlling how the frames are rendered.
+class MovieDiagnostic(Diagnostic):
+  @classmethod
+  def add_args (cls, parser, handled=[]):
+    super(MovieDiagnostic,cls).add_args(parser)
+    if len(handled) > 0: return  # Only run once
+    group = parser.add_argument_group('options for movies')
+    group.add_argument('--movie-jobs', action='store', type=int, default=1, metavar='N', help="Number of processes to use for rendering movie frames.  Default is %(default)s.")
+    group.add_argument('--movie-encoder', action='store', choices=('ffmpeg','mencoder'), help="Stream the movie frames directly into the given encoder, instead of saving them as PNG files first.")
+    group.add_argument('--keep-frames', action='store_true', help="Also save the movie frames as PNG files when using --movie-encoder.")
+    group.add_argument('--movie-prefetch', action='store', type=int, default=0, metavar='N', help="Number of timesteps to read at a time in the background, while the movie frames are being rendered (with timings reported for each movie).  Default is to read the data as each frame is rendered.")
+    group.add_argument('--movie-queue-depth', action='store', type=int, default=2, metavar='N', help="Maximum number of blocks of timesteps to read ahead of the movie frames being rendered.  Default is %(default)s.")
+    group.add_argument('--movie-template', action='store_true', help="Set up the figure and map projection once for each movie, and only redraw the data for each frame.")
+    handled.append(True)
+  def __init__ (self,movie_jobs=1,movie_encoder=None,keep_frames=False,movie_prefetch=0,movie_queue_depth=2,movie_template=False,**kwargs):
+    super(MovieDiagnostic,self).__init__(**kwargs)
+    # Extra arguments to pass to Movie.save()
+    self.movie_args = dict(jobs=movie_jobs, encoder=movie_encoder, keep_frames=keep_frames, prefetch=movie_prefetch, queue_depth=movie_queue_depth, template=movie_template)
+
 # Diagnostics that deal with a time range (pretty much all of them!).
 # Provides command-line arguments for pre-filtering the time range & frequency
 # of the inputs.
@@ -210,13 +244,9 @@ class TimeVaryingDiagnostic(Diagnostic):
     return [TimeVaryingDiagnostic._transform_input(self,inp) for inp in inputs]
 
 # Find all available diagnostics
-table = {}
-def _load_diagnostics ():
-  import pkgutil
-  import importlib
-  for loader, name, ispkg in pkgutil.walk_packages(__path__):
-    if ispkg: continue
-    importlib.import_module(__name__+'.'+name)
-_load_diagnostics()  # Allow the diagnostics to add their entries to this table
+# (the modules are only imported when their entries are first used)
+from ..registry import LazyTable
+table = LazyTable(__name__, __path__)
+del LazyTable
 
 
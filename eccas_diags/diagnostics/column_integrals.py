@@ -0,0 +1,94 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Compute the column integrals (average column, total column, total mass) of
+# many tracers at once.
+# The model data is streamed through once, and the results are written into
+# the cache under the same names that the xcol and totalmass diagnostics use,
+# so those diagnostics will pick them up afterwards.
+
+
+# Stand-in for the cache, which records what would have been written.
+class _DeferredCache (object):
+  def __init__ (self):
+    self.requests = []
+  def write (self, var, **kwargs):
+    self.requests.append((var, kwargs))
+    return var
+  def write_many (self, requests):
+    self.requests.extend(requests)
+    return [var for var, kwargs in requests]
+
+
+from . import Diagnostic
+class ColumnIntegrals(Diagnostic):
+  """
+  Compute the average columns, total columns and total mass of several
+  tracers in a single pass over the model data.
+  """
+  def __init__ (self, xcol_fields=[], totalmass_fields=[], **kwargs):
+    super(ColumnIntegrals,self).__init__(fieldname=None, units=None, **kwargs)
+    # List of (fieldname, units) for the average / total columns.
+    self.xcol_fields = xcol_fields
+    # List of fieldnames for the total mass.
+    self.totalmass_fields = totalmass_fields
+    # Arguments for setting up the individual diagnostics.
+    self.diag_args = kwargs
+
+  # Get the individual calculations to do on each input.
+  def _calculations (self):
+    from .xcol import XCol
+    from .totalmass import Totalmass
+    calculations = []
+    for fieldname, units in self.xcol_fields:
+      xcol = XCol(fieldname=fieldname, units=units, **self.diag_args)
+      calculations.append((xcol, xcol._avgcolumn))
+      calculations.append((xcol, xcol._totalcolumn))
+    for fieldname in self.totalmass_fields:
+      totalmass = Totalmass(fieldname=fieldname, units=None, **self.diag_args)
+      calculations.append((totalmass, totalmass._compute_totalmass))
+    return calculations
+
+  def do_all (self, inputs):
+    from . import TimeVaryingDiagnostic
+    from ..interfaces import DerivedProduct
+    from ..common import TimestepMemo
+    from pygeode.dataset import Dataset
+
+    calculations = self._calculations()
+    if len(calculations) == 0: return
+
+    for inp in inputs:
+      # Apply the same time range as the individual diagnostics.
+      model = TimeVaryingDiagnostic._transform_input(calculations[0][0], inp)
+      # Wrap the model data so each field is only read once per timestep,
+      # no matter how many calculations use it.
+      datasets = [Dataset([TimestepMemo(v) for v in d.vars], atts=d.atts) for d in model.datasets]
+      wrapped = DerivedProduct(datasets, source=model)
+      # Collect the cache requests from each calculation, instead of
+      # writing them one at a time.
+      wrapped.cache = _DeferredCache()
+      for diag, calculate in calculations:
+        try:
+          calculate(wrapped)
+        except (KeyError, ValueError): pass
+      # Write all the results together, one timestep at a time.
+      model.cache.write_many(wrapped.cache.requests)
@@ -45,7 +45,7 @@ class Concentration_VS_Height(ZonalMean):
 
     movie = CvH_Movie(fields, xlim=self.xlim, title='CvH', subtitles=subtitles, shape=shape, aspect_ratio=1.5)
 
-    movie.save(outdir=self.outdir, prefix=prefix)
+    movie.save(outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 
 from .movie import TiledMovie
@@ -121,7 +121,7 @@ class Diff(Diagnostic):
       diff.name += '_diff'
     # Cache the difference (so we get a global high/low for the colourbar)
     if self.cache_diff:
-      diff = inputs[0].cache.write(diff, prefix=inputs[0].name+'_'+str(self)+'_with_'+inputs[1].name+'_'+self.fieldname+self.suffix, suffix=self.end_suffix)
+      diff = inputs[0].cache.write(diff, prefix=inputs[0].name+'_'+str(self)+'_with_'+inputs[1].name+'_'+self.fieldname+self.suffix, suffix=self.end_suffix, access=self.cache_access)
       # Use symmetric range for the difference.
       x = max(abs(diff.atts['low']),abs(diff.atts['high']))
       diff.atts['low'] = -x
@@ -56,28 +56,63 @@ class DiurnalCycle(Timeseries):
   def compute_diurnal_mean_stddev (var):
     import numpy as np
     from pygeode.timeutils import reltime
+    from ..common import grouped_mean_stddev
     assert len(var.axes) == 1
     hours = reltime(var.time, units='hours')
     hours_mod = hours%24
     data = var.get()
-    diurnal_hours = sorted(set(hours_mod))
-    mean = []
-    stddev = []
-    for h in diurnal_hours:
-      current_data = data[hours_mod==h]
-      count = np.nansum(np.isfinite(current_data))
-      m = np.nansum(current_data) / count
-      mean.append (m)
-      v = np.nansum((current_data-m)**2)/(count-1)
-      stddev.append (np.sqrt(v))
-    # Wrap around to the start of the next day (complete cycle)
-    # Also, wrap to the end of the previous day, in case the first hour is > 0.
+    diurnal_hours, ihour = np.unique(hours_mod, return_inverse=True)
+    count, mean, stddev = grouped_mean_stddev(ihour, data, len(diurnal_hours))
+    return DiurnalCycle._wrap_hours(diurnal_hours, mean, stddev)
+
+  # Compute the diurnal mean and standard deviation for every (year, month,
+  # hour of day) of a timeseries, in a single pass over the data.
+  # Returns a dictionary with the years and hours of the groups, and arrays
+  # of the mean / standard deviation (shape is year x month x hour).
+  # Also counts the timesteps in each group (including missing data).
+  @staticmethod
+  def compute_monthly_diurnal_stats (taxis, data):
+    import numpy as np
+    from pygeode.timeutils import reltime
+    from ..common import grouped_mean_stddev
+    hours_mod = reltime(taxis, units='hours')%24
+    years, iyear = np.unique(taxis.year, return_inverse=True)
+    hours, ihour = np.unique(hours_mod, return_inverse=True)
+    shape = (len(years), 12, len(hours))
+    group = (iyear*12 + (taxis.month-1))*len(hours) + ihour
+    ngroups = shape[0]*shape[1]*shape[2]
+    ntimes = np.bincount(group, minlength=ngroups)
+    count, mean, stddev = grouped_mean_stddev(group, data, ngroups)
+    return dict(years=years, hours=hours, ntimes=ntimes.reshape(shape),
+                mean=mean.reshape(shape), stddev=stddev.reshape(shape))
+
+  # Wrap around to the start of the next day (complete cycle)
+  # Also, wrap to the end of the previous day, in case the first hour is > 0.
+  @staticmethod
+  def _wrap_hours (diurnal_hours, mean, stddev):
+    import numpy as np
+    diurnal_hours = list(diurnal_hours)
+    mean = list(mean)
+    stddev = list(stddev)
     if len(diurnal_hours) > 0:
       diurnal_hours = [diurnal_hours[-1]-24] + diurnal_hours + [diurnal_hours[0]+24]
       mean = [mean[-1]] + mean + [mean[0]]
       stddev = [stddev[-1]] + stddev + [stddev[0]]
     return np.array(diurnal_hours), np.array(mean), np.array(stddev)
 
+  # Get the diurnal cycle for a particular year and month, from the output of
+  # compute_monthly_diurnal_stats.
+  # Returns None if there is no data for this year/month.
+  @staticmethod
+  def _select_month (stats, year, month):
+    if year not in stats['years']: return None
+    iyear = list(stats['years']).index(year)
+    ntimes = stats['ntimes'][iyear,month-1,:]
+    # Need more than one timestep to get a diurnal cycle.
+    if ntimes.sum() <= 1: return None
+    present = ntimes > 0
+    return DiurnalCycle._wrap_hours(stats['hours'][present], stats['mean'][iyear,month-1,present], stats['stddev'][iyear,month-1,present])
+
   # Do the diurnal cycle plots.
   def do (self, inputs):
     from ..common import long_monthnames
@@ -102,8 +137,18 @@ class DiurnalCycle(Timeseries):
     nstations = len(inputs[0].datasets)
     for i in range(nstations):
       station = inputs[0].datasets[i].station.station[0]
+      outfiles = dict((year,"%s/%s_diurnal_cycle_%s_at_%s_for_%04d%s%s.%s"%(outdir,'_'.join(d.name for d in inputs), self.fieldname, station.replace('/','^'), year, self.suffix, self.end_suffix, self.image_format)) for year in years)
+      if all(exists(outfile) for outfile in outfiles.values()): continue
+      # Load the data for this station once, and compute the diurnal cycle
+      # statistics for all years and months at the same time.
+      stats = []
+      for inp in inputs:
+        var = inp.datasets[i][self.fieldname](station=station)
+        data = var.get().reshape(-1)
+        assert len(data) == len(var.time)
+        stats.append(self.compute_monthly_diurnal_stats(var.time, data))
       for year in years:
-        outfile = "%s/%s_diurnal_cycle_%s_at_%s_for_%04d%s%s.%s"%(outdir,'_'.join(d.name for d in inputs), self.fieldname, station.replace('/','^'), year, self.suffix, self.end_suffix, self.image_format)
+        outfile = outfiles[year]
         if exists(outfile): continue
         fig = pl.figure(figsize=(10,10))
         title = "%s diurnal cycle at %s (%04d)"%(self.fieldname,station,year)
@@ -116,10 +161,10 @@ class DiurnalCycle(Timeseries):
           pl.subplot(6,2,plotnum)
           pl.title(month_string)
 
-          for inp in inputs:
-            data = inp.datasets[i][self.fieldname](station=station)(year=year,month=month).squeeze()
-            if len(data.axes) == 0: continue
-            hours, data, std = self.compute_diurnal_mean_stddev(data)
+          for inp, inp_stats in zip(inputs, stats):
+            diurnal = self._select_month(inp_stats, year, month)
+            if diurnal is None: continue
+            hours, data, std = diurnal
             pl.plot(hours, data, color=inp.color, linestyle=inp.linestyle, linewidth=2, marker=inp.marker, markersize=10, markeredgecolor=inp.color, label=inp.title)
             if inp.std_style == 'lines':
               pl.plot(hours, data+std, color=inp.color, linestyle='--')
@@ -21,14 +21,16 @@
 
 # Horizontal slice movie.
 
-from . import TimeVaryingDiagnostic
+from . import TimeVaryingDiagnostic, MovieDiagnostic
 from .map import Map
-class HorzSlice(TimeVaryingDiagnostic,Map):
+class HorzSlice(TimeVaryingDiagnostic,Map,MovieDiagnostic):
   """
   Sample data at a particular vertical level.
   """
 
   short_name = True  # Use shortened name for difference field.
+  shared_reads = True  # Slices are computed through the cache.
+  cache_access = 'map'
 
   def __str__ (self):
     if hasattr(self,'level'):
@@ -69,7 +71,7 @@ class HorzSlice(TimeVaryingDiagnostic,Map):
     c = rotate_grid(c)
 
     # Cache the data
-    c = input.cache.write(c,prefix=input.name+'_'+c.zaxis.name+z+"_"+self.fieldname+self.suffix, suffix=self.end_suffix)
+    c = input.cache.write(c,prefix=input.name+'_'+c.zaxis.name+z+"_"+self.fieldname+self.suffix, suffix=self.end_suffix, access=self.cache_access)
 
     return DerivedProduct(c, source=input)
 
@@ -100,7 +102,7 @@ class HorzSlice(TimeVaryingDiagnostic,Map):
 
     movie = ContourMovie(fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio = aspect_ratio, cmaps=cmaps, cap_extremes=cap_extremes, extra_plotvar_args=self.plotvar_map_args)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 
 from . import table
@@ -41,7 +41,7 @@ class LatDist(ZonalMean,XCol):
 
     movie = LatDistMovie(fields, inputs, title=title, figsize=(10,4))
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 # Instead of tiling the fields, overlay them all on a single plot.
 # Copied and modified from ContourMovie code.
@@ -25,6 +25,7 @@
 # collecting the images into a movie.
 # To use this class, create a sub-class and define an appropriate 'render'
 # method.
+from .. import profiler
 class Movie(object):
   def __init__ (self, fields, figsize=None, extra_plotvar_args={}):
     self.fields = fields
@@ -44,13 +45,183 @@ class Movie(object):
         self.global_range[field.name] = (min(low1,low),max(high1,high))
     self.figsize = figsize
     self.extra_plotvar_args = extra_plotvar_args
+    # Figure to re-use for each frame (when rendering from a template).
+    self._template = None
 
-  # Save the movie.
-  def save (self, outdir, prefix):
+  # Whether this movie can be rendered from a frame template
+  # (i.e., implements the 'setup' and 'update' methods).
+  can_template = False
+
+  # Determine the output filename and the date string for a frame of the
+  # movie.
+  @staticmethod
+  def _frame_info (taxis, i, imagedir):
+    outfile = imagedir + "/"
+    datestring = ""
+    #TODO: more comprehensive function for mapping different combinations
+    # of year/month/day/hour/minute to filename strings and title strings.
+    year = getattr(taxis,'year',None)
+    if year is not None:
+      outfile += "%04d"%year[i]
+      datestring = "%04d"%year[i]
+    month = getattr(taxis,'month',None)
+    if month is not None:
+      outfile += "%02d"%month[i]
+      if datestring != "": datestring += "-"
+      datestring += "%02d"%month[i]
+    day = getattr(taxis,'day',None)
+    if day is not None:
+      outfile += "%02d"%day[i]
+      if datestring != "": datestring += "-"
+      datestring += "%02d"%day[i]
+    hour = getattr(taxis,'hour',None)
+    if hour is not None:
+      outfile += "%02d"%hour[i]
+      if datestring != "": datestring += " "
+      datestring += "%02d"%hour[i]
+    minute = getattr(taxis,'minute',None)
+    if minute is not None:
+      # If the minutes are all '0', then don't use minutes in the filenames.
+      # Allows backwards compatibility with previous version of the diagnostics.
+      # Otherwise, need to include minute information to distinguish each
+      # timestep.
+      if list(set(minute)) != [0]:
+        outfile += "%02d"%minute[i]
+      if datestring != "": datestring += ":"
+      datestring += "%02d"%minute[i]
+
+    outfile += ".png"
+    return outfile, datestring
+
+  # Render a single frame of the movie.
+  # The frame is saved to an image file (if a filename is given), and/or
+  # returned as raw RGB pixels (if rgb=True).
+  # The data is sampled from the given fields (default is the fields of the
+  # movie).
+  def _save_frame (self, t, outfile, datestring, rgb=False, fields=None):
     import matplotlib.pyplot as pl
+    if fields is None: fields = self.fields
+    # Sample the fields at the current time
+    fields = [f(time=t) for f in fields]
+    if self._template is not None:
+      # Build the figure on the first frame, then only update the data.
+      fig = self._template
+      if not hasattr(fig, 'movie_setup'):
+        self.setup (fig, fields)
+        fig.movie_setup = True
+      self.update (fig, fields, datestring)
+    else:
+      fig = pl.figure(figsize=self.figsize)
+      self.render (fig, fields, datestring)
+    if outfile is not None:
+      fig.savefig(outfile)
+    pixels = None
+    if rgb:
+      fig.canvas.draw()
+      width, height = fig.canvas.get_width_height()
+      pixels = (width, height, fig.canvas.tostring_rgb())
+    if fig is not self._template:
+      pl.close(fig)
+    return pixels
+
+  # Read the data for the given frames ahead of time, in a background thread.
+  # The fields are loaded in blocks of 'block_size' timesteps, with up to
+  # 'queue_depth' blocks waiting to be rendered.
+  # Yields each frame, along with the fields to sample it from.
+  # Also accumulates the time spent reading into the 'timings' dictionary.
+  def _prefetch (self, frames, block_size, queue_depth, timings):
+    from threading import Thread
+    from Queue import Queue
+    from time import time
+    queue = Queue(maxsize=queue_depth)
+    done = []
+    def read_blocks():
+      try:
+        for i in range(0,len(frames),block_size):
+          if len(done) > 0: return  # Consumer went away?
+          block = frames[i:i+block_size]
+          start = time()
+          times = (block[0][0], block[-1][0])
+          fields = [f(time=times).load() if f.hasaxis('time') else f for f in self.fields]
+          queue.put((block, fields, time()-start))
+        queue.put(None)
+      except Exception as e:
+        queue.put(e)
+    reader = Thread(target=read_blocks)
+    reader.daemon = True
+    reader.start()
+    try:
+      while True:
+        start = time()
+        item = queue.get()
+        timings['wait'] += time() - start
+        if item is None: break
+        if isinstance(item, Exception): raise item
+        block, fields, seconds = item
+        timings['read'] += seconds
+        for frame in block:
+          yield frame, fields
+    finally:
+      # Stop the reader thread (if we're bailing out early).
+      done.append(True)
+      while reader.is_alive():
+        if not queue.empty(): queue.get()
+        reader.join(0.1)
+
+  # Render the given frames, in order.
+  # Yields the result of each frame.
+  # Parameters:
+  #   jobs - Number of processes to use for rendering.
+  #   prefetch - Number of timesteps to read at a time in the background
+  #     (0 to disable read-ahead).  Only applies when rendering in serial.
+  #   queue_depth - Maximum number of blocks of timesteps to read ahead.
+  def _render_frames (self, frames, jobs=1, prefetch=0, queue_depth=2):
+    from time import time
+    if jobs > 1 and len(frames) > 1:
+      from multiprocessing import Pool
+      # The worker processes get a copy of this movie object when they're
+      # forked, so only the time values and filenames need to be sent to them.
+      _movie[:] = [self]
+      pool = Pool(jobs)
+      try:
+        for result in pool.imap(_save_frame, frames):
+          yield result
+      finally:
+        pool.close()
+        pool.join()
+        _movie[:] = []
+    elif prefetch > 0 and len(frames) > 0:
+      timings = dict(read=0., wait=0., render=0.)
+      for frame, fields in self._prefetch(frames, prefetch, queue_depth, timings):
+        start = time()
+        result = self._save_frame (*frame, fields=fields)
+        timings['render'] += time() - start
+        yield result
+      n = len(frames)
+      print "Frame timings: read %.3fs, render %.3fs, waiting for data %.3fs (per frame, over %d frames)"%(timings['read']/n, timings['render']/n, timings['wait']/n, n)
+    else:
+      for frame in frames:
+        yield self._save_frame (*frame)
+
+  # Save the movie.
+  # Parameters:
+  #   jobs (default: 1) - Number of processes to use for rendering the frames.
+  #   encoder (default: None) - Stream the raw frames directly into this
+  #     encoder, instead of going through PNG files.  Can be the name of one
+  #     of the entries in the 'encoders' table, or a function that returns the
+  #     encoder command for the given output file, frame size, and frame rate.
+  #   keep_frames (default: False) - When streaming to an encoder, also save
+  #     the frames as PNG files.
+  #   prefetch (default: 0) - Number of timesteps to read at a time in a
+  #     background thread, while the current frames are being rendered.
+  #   queue_depth (default: 2) - Maximum number of blocks of timesteps to
+  #     read ahead.
+  #   template (default: False) - Build the figure once, and only update the
+  #     data for each frame (if supported by this type of movie).
+  @profiler.timed('movie_save')
+  def save (self, outdir, prefix, jobs=1, encoder=None, keep_frames=False, prefetch=0, queue_depth=2, template=False):
     from os.path import exists
     from os import makedirs
-    from pygeode.progress import PBar
 
     # Early exit if the final movie file already exists.
     moviefile = "%s/%s.avi"%(outdir,prefix)
@@ -65,67 +236,86 @@ class Movie(object):
       raise ValueError ("No common time period for %s"%prefix)
 
     imagedir = outdir + "/images_%s"%prefix
-    if not exists(imagedir): makedirs(imagedir)
+    if (encoder is None or keep_frames) and not exists(imagedir):
+      makedirs(imagedir)
 
     # Use the first field to define the frames
     taxis = self.fields[0].time(time=(start,end))
-    pbar = PBar()
-    print "Saving %s images"%prefix
-    for i,t in enumerate(taxis):
 
-      # Sample the fields at the current time
-      fields = [f(time=t) for f in self.fields]
-
-      outfile = imagedir + "/"
-      datestring = ""
-      #TODO: more comprehensive function for mapping different combinations
-      # of year/month/day/hour/minute to filename strings and title strings.
-      year = getattr(fields[0].time,'year',[None])[0]
-      if year is not None:
-        outfile += "%04d"%year
-        datestring = "%04d"%year
-      month = getattr(fields[0].time,'month',[None])[0]
-      if month is not None:
-        outfile += "%02d"%month
-        if datestring != "": datestring += "-"
-        datestring += "%02d"%month
-      day = getattr(fields[0].time,'day',[None])[0]
-      if day is not None:
-        outfile += "%02d"%day
-        if datestring != "": datestring += "-"
-        datestring += "%02d"%day
-      hour = getattr(fields[0].time,'hour',[None])[0]
-      if hour is not None:
-        outfile += "%02d"%hour
-        if datestring != "": datestring += " "
-        datestring += "%02d"%hour
-      minute = getattr(fields[0].time,'minute',[None])[0]
-      if minute is not None:
-        # If the minutes are all '0', then don't use minutes in the filenames.
-        # Allows backwards compatibility with previous version of the diagnostics.
-        # Otherwise, need to include minute information to distinguish each
-        # timestep.
-        if list(set(taxis.minute)) != [0]:
-          outfile += "%02d"%minute
-        if datestring != "": datestring += ":"
-        datestring += "%02d"%minute
-
-      outfile += ".png"
+    if template and self.can_template:
+      import matplotlib.pyplot as pl
+      self._template = pl.figure(figsize=self.figsize)
+    try:
+      if encoder is not None:
+        return self._encode (taxis, moviefile, imagedir, encoder, keep_frames, jobs=jobs, prefetch=prefetch, queue_depth=queue_depth)
+      self._save_images (taxis, moviefile, imagedir, prefix, jobs=jobs, prefetch=prefetch, queue_depth=queue_depth)
+    finally:
+      if self._template is not None:
+        import matplotlib.pyplot as pl
+        pl.close(self._template)
+        self._template = None
 
-      if not exists(outfile):
-        fig = pl.figure(figsize=self.figsize)
-        self.render (fig, fields, datestring)
-        fig.savefig(outfile)
-        pl.close(fig)
+  # Save the frames as image files, then generate the movie from them.
+  def _save_images (self, taxis, moviefile, imagedir, prefix, **render_args):
+    from os.path import exists
+    from pygeode.progress import PBar
 
-      pbar.update(i*100./len(taxis))
+    # Determine which frames still need to be rendered.
+    # (skip frames that were already saved, e.g. from an interrupted run).
+    frames = []
+    for i,t in enumerate(taxis):
+      outfile, datestring = self._frame_info(taxis, i, imagedir)
+      if not exists(outfile):
+        frames.append((t, outfile, datestring))
 
+    pbar = PBar()
+    print "Saving %s images"%prefix
+    for i, result in enumerate(self._render_frames(frames, **render_args)):
+      pbar.update(i*100./len(frames))
     pbar.update(100)
 
     # Generate the movie
     from os import system
     system("mencoder -o %s mf://%s/*.png -ovc lavc -lavcopts vcodec=msmpeg4v2"%(moviefile, imagedir))
 
+  # Stream the frames directly into an encoder process.
+  def _encode (self, taxis, moviefile, imagedir, encoder, keep_frames, **render_args):
+    from os import rename
+    from subprocess import Popen, PIPE
+    from pygeode.progress import PBar
+
+    if not callable(encoder):
+      encoder = encoders[encoder]
+
+    frames = []
+    for i,t in enumerate(taxis):
+      outfile, datestring = self._frame_info(taxis, i, imagedir)
+      if not keep_frames: outfile = None
+      frames.append((t, outfile, datestring, True))
+
+    # Write to a temporary file, so an interrupted encoding doesn't leave a
+    # partial movie behind (which would be skipped on the next run).
+    tmpfile = moviefile + ".part"
+    pbar = PBar()
+    print "Encoding %s"%moviefile
+    proc = None
+    try:
+      for i, (width, height, pixels) in enumerate(self._render_frames(frames, **render_args)):
+        # Start the encoder once the frame size is known.
+        if proc is None:
+          proc = Popen(encoder(tmpfile, width, height, fps), stdin=PIPE)
+        proc.stdin.write(pixels)
+        pbar.update(i*100./len(frames))
+    finally:
+      if proc is not None:
+        proc.stdin.close()
+        status = proc.wait()
+    if proc is None: return
+    if status != 0:
+      raise IOError ("Encoder exited with status %d for %s"%(status,moviefile))
+    rename (tmpfile, moviefile)
+    pbar.update(100)
+
   # Render the given field snapshots into the figure, producing one frame of
   # the movie.
   # NOTE: This method is a stub.  It needs to be implemented in a sub-class
@@ -133,6 +323,46 @@ class Movie(object):
   def render (self, fig, fields, datestring):
     raise NotImplementedError
 
+  # Set up the figure for a frame template (axes, map projections, etc.).
+  # Called once per movie, with the fields from the first frame.
+  # NOTE: Only needed for sub-classes that set can_template = True.
+  def setup (self, fig, fields):
+    raise NotImplementedError
+
+  # Update the data in the frame template.
+  # NOTE: Only needed for sub-classes that set can_template = True.
+  def update (self, fig, fields, datestring):
+    raise NotImplementedError
+
+
+# Movie being rendered by the worker processes.
+_movie = []
+
+# Render a frame of the movie (in a worker process).
+def _save_frame (frame):
+  return _movie[0]._save_frame (*frame)
+
+# Frame rate for the movies.
+fps = 25
+
+# Encoders for streaming raw RGB frames into a movie file.
+# Each entry takes the output filename, frame size, and frame rate, and returns
+# the command to run.  The frames are fed through stdin.
+encoders = {}
+
+def _ffmpeg (moviefile, width, height, fps):
+  return ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo',
+          '-pix_fmt', 'rgb24', '-s', '%dx%d'%(width,height), '-r', str(fps),
+          '-i', '-', '-f', 'avi', '-vcodec', 'msmpeg4v2', '-q:v', '2', moviefile]
+encoders['ffmpeg'] = _ffmpeg
+
+def _mencoder (moviefile, width, height, fps):
+  return ['mencoder', '-really-quiet', '-', '-demuxer', 'rawvideo',
+          '-rawvideo', 'w=%d:h=%d:format=rgb24:fps=%d'%(width,height,fps),
+          '-ovc', 'lavc', '-lavcopts', 'vcodec=msmpeg4v2', '-of', 'avi',
+          '-o', moviefile]
+encoders['mencoder'] = _mencoder
+
 
 # A movie with tiled subplots.
 # There will be a different subtitle for each panel.
@@ -176,6 +406,29 @@ class TiledMovie(Movie):
   def render_panel (self, axis, field, n):
     raise NotImplementedError
 
+  # Frame template for the tiled panels.
+  def setup (self, fig, fields):
+    title_size = 20
+    fig.subplots_adjust (top = 1-2.5*title_size/72./self.height)
+    self._axes = []
+    for k,field in enumerate(fields):
+      shape = self.shape+(k+1,)
+      ax = fig.add_subplot(*shape)
+      self.setup_panel (ax, field, k)
+      self._axes.append(ax)
+    self._suptitle = fig.suptitle('', fontsize=title_size)
+
+  def update (self, fig, fields, datestring):
+    for k,field in enumerate(fields):
+      self.update_panel (self._axes[k], field, k)
+    self._suptitle.set_text(self.title+'  -  '+datestring)
+
+  # Implement these methods for each subclass that supports frame templates.
+  def setup_panel (self, axis, field, n):
+    raise NotImplementedError
+  def update_panel (self, axis, field, n):
+    raise NotImplementedError
+
 
 # A movie with filled contour plots.
 class ContourMovie(TiledMovie):
@@ -211,12 +464,75 @@ class ContourMovie(TiledMovie):
     else:
       plotvar (field, ax=axis, clevs=clevs, title=self.subtitles[n], cmap=self.cmaps[n], **deepcopy(self.extra_plotvar_args))
 
+  # Frame template for the contour plots.
+  # The axes, map projection, and colourbar are set up once, and only the
+  # filled contours are replaced on each frame.
+  can_template = True
+
+  def setup_panel (self, axis, field, n):
+    from .plot_shortcuts import get_axes_args, get_XYC
+    from pygeode.axis import Lat, Lon
+    import numpy as np
+    axes_args, field = get_axes_args(field)
+    X, Y, C = get_XYC(field)
+    if not hasattr(self, '_panels'): self._panels = {}
+    if isinstance(field.axes[0],Lat) and isinstance(field.axes[1],Lon):
+      # Set up the map
+      map_args = dict(self.extra_plotvar_args.get('projection',{}))
+      meridians = map_args.pop('meridians',[0,60,120,180,240,300,360])
+      parallels = map_args.pop('parallels',[-90,-60,-30,0,30,60,90])
+      if 'projection' not in map_args:
+        map_args.update(projection='cyl', llcrnrlon=X[0], urcrnrlon=X[-1], llcrnrlat=min(Y), urcrnrlat=max(Y))
+      basemap = get_basemap(**map_args)
+      X, Y = basemap(*np.meshgrid(X,Y))
+      basemap.drawcoastlines(ax=axis)
+      basemap.drawparallels(parallels, labels=[True,True,False,False], ax=axis)
+      basemap.drawmeridians(meridians, labels=[False,False,False,True], ax=axis)
+      basemap.drawmapboundary(ax=axis)
+    else:
+      basemap = None
+      # Handle scaling first, because setting this screws up other custom
+      # attributes like ticks.
+      axis.set_xscale(axes_args['xscale'])
+      axis.set_yscale(axes_args['yscale'])
+      axis.set_xlim(axes_args['xlim'])
+      axis.set_ylim(axes_args['ylim'])
+      axis.set_xlabel(axes_args['xlabel'])
+      axis.set_ylabel(axes_args['ylabel'])
+    axis.set_title(self.subtitles[n])
+    self._panels[n] = [basemap, X, Y, None]
+    # Draw the first frame, so we can attach a colourbar to it.
+    self.update_panel (axis, field, n)
+    axis.figure.colorbar(self._panels[n][3], ax=axis)
+
+  def update_panel (self, axis, field, n):
+    from .plot_shortcuts import get_XYC
+    basemap, X, Y, contours = self._panels[n]
+    C = get_XYC(field.squeeze())[2]
+    # Remove the contours from the previous frame.
+    if contours is not None:
+      for c in contours.collections: c.remove()
+    kwargs = dict(levels=self.clevs[field.name], cmap=self.cmaps[n])
+    if self.cap_extremes[n] is True: kwargs['extend'] = 'both'
+    if basemap is not None:
+      contours = basemap.contourf(X, Y, C, ax=axis, **kwargs)
+    else:
+      contours = axis.contourf(X, Y, C, **kwargs)
+    self._panels[n][3] = contours
+
 class ZonalMovie (ContourMovie):
   # Modify the panel rendering to show the y-axis on the first panel,
   # and override the latitude labels
   def render_panel (self, axis, field, n):
     from .movie import ContourMovie
     ContourMovie.render_panel (self, axis, field, n)
+    self._decorate_panel (axis, field, n)
+
+  def setup_panel (self, axis, field, n):
+    ContourMovie.setup_panel (self, axis, field, n)
+    self._decorate_panel (axis, field, n)
+
+  def _decorate_panel (self, axis, field, n):
     if n == 0:
       axis.set_ylabel(field.zaxis.name)
     else:
@@ -226,3 +542,12 @@ class ZonalMovie (ContourMovie):
       axis.set_xticklabels(['90S','','','EQ','','','90N'])
 
 
+# Cache of map projections, so the coastlines, etc. only need to be
+# processed once for each set of map parameters.
+_basemaps = {}
+def get_basemap (**kwargs):
+  from mpl_toolkits.basemap import Basemap
+  key = repr(sorted(kwargs.items()))
+  if key not in _basemaps:
+    _basemaps[key] = Basemap(**kwargs)
+  return _basemaps[key]
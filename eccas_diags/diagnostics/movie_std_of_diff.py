@@ -22,8 +22,8 @@
 from .zonalmean import ZonalMean
 from .vinterp import VInterp
 from .diff import Diff
-from . import TimeVaryingDiagnostic
-class ZonalSTDofDiff(ZonalMean,Diff,VInterp,TimeVaryingDiagnostic):
+from . import TimeVaryingDiagnostic, MovieDiagnostic
+class ZonalSTDofDiff(ZonalMean,Diff,VInterp,TimeVaryingDiagnostic,MovieDiagnostic):
   """
   Zonal standard deviation of the difference between two fields, animated in time.
   """
@@ -58,7 +58,7 @@ class ZonalSTDofDiff(ZonalMean,Diff,VInterp,TimeVaryingDiagnostic):
 
     movie = ZonalMovie(fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio=aspect_ratio, cmaps=cmaps, cap_extremes=cap_extremes)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 
 from . import table
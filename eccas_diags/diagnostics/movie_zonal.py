@@ -22,8 +22,8 @@
 
 from .zonalmean import ZonalMean as Zonal
 from .vinterp import VInterp
-from . import TimeVaryingDiagnostic
-class ZonalMean(Zonal,VInterp,TimeVaryingDiagnostic):
+from . import TimeVaryingDiagnostic, MovieDiagnostic
+class ZonalMean(Zonal,VInterp,TimeVaryingDiagnostic,MovieDiagnostic):
   """
   Zonal mean (or standard deviation) of a field, animated in time.
   """
@@ -48,7 +48,7 @@ class ZonalMean(Zonal,VInterp,TimeVaryingDiagnostic):
 
     movie = ZonalMovie(fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio=aspect_ratio, cmaps=cmaps, cap_extremes=cap_extremes)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 
 from . import table
@@ -26,6 +26,7 @@ class AircraftProfiles(TimeVaryingDiagnostic,ImageDiagnostic):
   """
   Mean vertical profiles, sampled at obs locations.
   """
+  cache_access = 'timeseries'
   @classmethod
   def add_args (cls, parser, handled=[]):
     super(AircraftProfiles,cls).add_args(parser)
@@ -168,12 +169,12 @@ class AircraftProfiles(TimeVaryingDiagnostic,ImageDiagnostic):
     # Disable time splitting for the cache file, since open_multi doesn't wor
     # very well with the encoded station data.
     print 'Sampling %s data at %s'%(model.name, list(outfield.station.station))
-    outfield = model.cache.write(outfield, prefix=model.name+'_at_%s_%s%s_full'%(obs.name,fieldname,self.suffix), split_time=False, suffix=self.end_suffix)
-    gph = model.cache.write(gph, prefix=model.name+'_at_%s_%s%s_full'%(obs.name,'geopotential_height',self.suffix), split_time=False, suffix=self.end_suffix)
+    outfield = model.cache.write(outfield, prefix=model.name+'_at_%s_%s%s_full'%(obs.name,fieldname,self.suffix), split_time=False, suffix=self.end_suffix, access=self.cache_access)
+    gph = model.cache.write(gph, prefix=model.name+'_at_%s_%s%s_full'%(obs.name,'geopotential_height',self.suffix), split_time=False, suffix=self.end_suffix, access=self.cache_access)
 
     # Interpolate the model to the fixed vertical levels.
     outfield = interpolate(outfield, inaxis='zaxis', outaxis=z, inx=gph)
-    outfield = model.cache.write(outfield, prefix=model.name+'_at_%s_%s%s_zinterp'%(obs.name,fieldname,self.suffix), split_time=False, suffix=self.end_suffix)
+    outfield = model.cache.write(outfield, prefix=model.name+'_at_%s_%s%s_zinterp'%(obs.name,fieldname,self.suffix), split_time=False, suffix=self.end_suffix, access=self.cache_access)
 
 
     #######################
@@ -212,7 +213,7 @@ class AircraftProfiles(TimeVaryingDiagnostic,ImageDiagnostic):
           continue
         sample = interpolate(sample,'time',times,interp_type='linear')
         sample = sample.transpose('time','station','zaxis')
-        sample = model.cache.write(sample, prefix=model.name+'_at_%s_%s_%s%s_obstimes'%(obs.name,station,fieldname,self.suffix), split_time=False, suffix=self.end_suffix)
+        sample = model.cache.write(sample, prefix=model.name+'_at_%s_%s_%s%s_obstimes'%(obs.name,station,fieldname,self.suffix), split_time=False, suffix=self.end_suffix, access=self.cache_access)
 
       yield sample
 
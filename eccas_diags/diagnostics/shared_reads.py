@@ -0,0 +1,101 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Fill in the cache files for many diagnostics in a single pass over the
+# input data.
+# Each diagnostic is set up as usual, but the cache writes are only recorded.
+# Then all the cached fields (zonal means, station samples, column averages,
+# level slices, ...) are computed together, one timestep at a time, so each
+# timestep of the raw data is only read once.  The diagnostics are run
+# afterwards, and pick up their data from the cache.
+
+
+from . import Diagnostic
+from .column_integrals import _DeferredCache
+class SharedReads(Diagnostic):
+  """
+  Compute the cached fields for several diagnostics in a single pass over
+  the input data.
+  """
+  def __init__ (self, jobs=[], **kwargs):
+    super(SharedReads,self).__init__(fieldname=None, units=None, **kwargs)
+    # List of diagnostics to plan for, as dictionaries with diagname,
+    # fieldname, units, and any extra arguments.
+    self.jobs = jobs
+    # Arguments for setting up the individual diagnostics.
+    self.diag_args = kwargs
+    # Stop on the first problem with a diagnostic?
+    self.crash = kwargs.get('crash',False)
+
+  # Get the jobs for the diagnostics that can take part.
+  def _jobs (self):
+    from . import table
+    return [job for job in self.jobs if job.get('type','diag') == 'diag' and table[job['diagname']].shared_reads]
+
+  def do_all (self, inputs):
+    from ..interfaces import DerivedProduct
+    from ..common import TimestepMemo
+    from pygeode.dataset import Dataset
+    from . import table
+    from ..cache import domain_hash
+    from warnings import warn
+
+    jobs = self._jobs()
+    if len(jobs) == 0: return
+
+    # Wrap the data so each field is only read once per timestep, no matter
+    # how many diagnostics use it.
+    wrapped = []
+    for inp in inputs:
+      datasets = [Dataset([TimestepMemo(v) for v in d.vars], atts=d.atts) for d in inp.datasets]
+      w = DerivedProduct(datasets, source=inp)
+      # Collect the cache requests from each diagnostic, instead of
+      # writing them one at a time.
+      w.cache = _DeferredCache()
+      wrapped.append(w)
+
+    # Go through the input stages of each diagnostic (up to the point where
+    # the plots would be made).
+    for job in jobs:
+      try:
+        diag = table[job['diagname']](fieldname=job['fieldname'], units=job['units'], **dict(self.diag_args,**job['extra']))
+        for current_inputs in diag._input_combos(diag._select_inputs(wrapped)):
+          diag._transform_inputs(current_inputs)
+      # The diagnostic will still be run afterwards, but it will have to read
+      # its own data.
+      except Exception as e:
+        if self.crash: raise
+        warn ("Unable to include '%s %s' in the shared reads (it will read its own data): %s"%(job['diagname'], job['fieldname'], e))
+
+    # Write all the results together, one timestep at a time.
+    for inp, w in zip(inputs, wrapped):
+      if inp.cache is None or len(w.cache.requests) == 0: continue
+      # Some fields are used by more than one diagnostic, but they only need
+      # to be computed once.
+      requests = []
+      keys = set()
+      for var, kwargs in w.cache.requests:
+        key = (kwargs['prefix'], kwargs.get('suffix',''), domain_hash(var))
+        if key in keys: continue
+        keys.add(key)
+        requests.append((var, kwargs))
+      inp.cache.write_many(requests)
+
@@ -23,6 +23,8 @@
 
 from . import Diagnostic
 class StationComparison(Diagnostic):
+  shared_reads = True  # Station samples are computed through the cache.
+  cache_access = 'timeseries'
   @classmethod
   def add_args (cls, parser, handled=[]):
     super(StationComparison,cls).add_args(parser)
@@ -105,6 +107,7 @@ class StationComparison(Diagnostic):
     from pygeode.axis import concat
     from ..common import closeness_to_surface, number_of_timesteps, select_surface
     from ..interfaces import DerivedProduct
+    from ..station_data import split_stations
 
     # Determine which obs fields are available at which stations.
     obs_stations = dict()
@@ -141,18 +144,22 @@ class StationComparison(Diagnostic):
     # Sample at *all* applicable sites, and make one cache file.
     vars_allsites = map(select_surface,vars_allsites)
     vars_allsites = [StationSample(var,obs_stations[var.name],lat=lat,lon=lon) for var in vars_allsites]
-    vars_allsites = [model.cache.write(var, prefix=model.name+'_at_%s_%s%s'%(obs.name,var.name,self.suffix), split_time=False, suffix=self.end_suffix) if len(var.time) > 0 else var for var in vars_allsites]
+    vars_allsites = [model.cache.write(var, prefix=model.name+'_at_%s_%s%s'%(obs.name,var.name,self.suffix), split_time=False, suffix=self.end_suffix, access=self.cache_access) if len(var.time) > 0 else var for var in vars_allsites]
+
+    tables = map(StationTable, vars_allsites)
 
     out_datasets = []
 
     # Do a 1:1 sampling of the model at the obs sites
-    for obs_dataset in obs.datasets:
+    for obs_dataset in split_stations(obs.datasets):
 
       # Select out the particular station we want for this iteration.
       # Ignore variables that don't have all the stations we need (works around
       # an issue with no_require_obs, when not all real variables are
       # available at all stations).
-      vars = [var(l_station=obs_dataset.station.station) for var in vars_allsites if set(obs_dataset.station.station) <= set(var.station.station)]
+      # The station data is served from a table that's shared between all
+      # the stations, so it only needs to be read once.
+      vars = [StationView(table, obs_dataset.station.station) for table in tables if set(obs_dataset.station.station) <= set(table.var.station.station)]
       if len(vars) > 0:
         out_datasets.append(Dataset(vars))
 
@@ -174,6 +181,8 @@ class StationComparison(Diagnostic):
   # For each observation dataset,
   # interpolate model data directly to station locations.
   def _input_combos (self, inputs):
+    from ..interfaces import DerivedProduct
+    from ..station_data import split_stations
     all_obs = [m for m in inputs if self._has_station_axis(m)]
     models = [m for m in inputs if m not in all_obs]
 
@@ -191,6 +200,9 @@ class StationComparison(Diagnostic):
         m = self._select_obs_sites(m)
         out_models.append(m)
       if len(out_models) == 0: continue  # Don't do obs-only diagnostic.
+      # Get the individual stations (if the obs were consolidated into
+      # multi-station datasets).
+      obs = DerivedProduct(split_stations(obs.datasets), source=obs)
       # Subset the obs locations (if particular locations were given on the
       # command-line).
       obs = self._select_obs_sites(obs)
@@ -208,6 +220,61 @@ class StationComparison(Diagnostic):
       if station.startswith(s): return s
     return None
 
+# Bulk access to a field sampled at many stations.
+# The data for all stations is read at once (the first time any station is
+# requested), and kept in memory for the other stations.
+class StationTable(object):
+  def __init__ (self, var):
+    self.var = var
+    self.istation = var.whichaxis('station')
+    self._key = None
+    self._values = None
+  # Get the data for all stations, over the given slices of the other axes.
+  def get (self, slices):
+    import numpy as np
+    key = []
+    for sl in slices:
+      if isinstance(sl,slice): key.append((sl.start,sl.stop,sl.step))
+      else: key.append(np.asarray(sl).tostring())
+    if key != self._key:
+      insl = list(slices)
+      insl.insert(self.istation, slice(None))
+      self._values = None  # Free up the previous block first.
+      self._values = self.var[tuple(insl)]
+      self._key = key
+    return self._values
+
+from pygeode.var import Var
+# A view of particular station(s) from a StationTable.
+class StationView(Var):
+  def __init__ (self, table, stations):
+    from pygeode.var import Var, copy_meta
+    var = table.var
+    all_stations = list(var.station.station)
+    self.indices = [all_stations.index(s) for s in stations]
+    axes = list(var.axes)
+    axes[table.istation] = var(l_station=stations).station
+    Var.__init__(self, axes, dtype=var.dtype)
+    copy_meta(var,self)
+    self.table = table
+  def getview (self, view, pbar):
+    import numpy as np
+    istation = self.table.istation
+    slices = list(view.slices)
+    stations = np.asarray(self.indices)[slices.pop(istation)]
+    values = self.table.get(slices)
+    pbar.update(100)
+    # Single station?  Can slice it out directly (instead of going through
+    # np.take).
+    # The result is a copy, since the block is shared with all the other
+    # stations.
+    if stations.size == 1:
+      sl = [slice(None)]*values.ndim
+      sl[istation] = slice(stations.flat[0],stations.flat[0]+1)
+      return np.array(values[tuple(sl)])
+    return np.take(values, stations, axis=istation)
+del Var
+
 # Sample a model field at station locations
 def StationSample (model_data, station_axis, lat=None,lon=None):
   if model_data.hasaxis("station"):
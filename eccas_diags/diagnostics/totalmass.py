@@ -26,6 +26,7 @@ class Totalmass(TimeVaryingDiagnostic,ImageDiagnostic):
   Compute the total mass budget for a field.  Show the time variation as a
   1D line plot.
   """
+  cache_access = 'timeseries'
   def __init__ (self, **kwargs):
     super(Totalmass,self).__init__(**kwargs)
     self.require_fieldname = False # Will provide our own checks below.
@@ -35,7 +36,7 @@ class Totalmass(TimeVaryingDiagnostic,ImageDiagnostic):
     selected = []
     for inp in inputs:
       try:
-        totalmass = self._compute_totalmass(inp,cache=False)
+        self._totalmass_plan(inp)
         selected.append(inp)
         continue
       except KeyError: pass
@@ -104,47 +105,64 @@ class Totalmass(TimeVaryingDiagnostic,ImageDiagnostic):
         pass
     return computed
 
+  # Figure out which fields to use for the total mass, without doing any of
+  # the calculations.
+  # Returns the method to use, and the source fields (or the conversion plan).
+  # Raises KeyError if the product doesn't have what's needed.
+  def _totalmass_plan (self, model):
+    from ..common import conversion_plan, number_of_levels, number_of_timesteps
+    fieldname = self.fieldname
+
+    # Do we have the pressure change in the vertical?
+    if model.have('dp'):
+
+      # Total air mass?
+      if fieldname == 'air':
+       return 'air', model.find_best(['dp','blended_area'], maximize=(number_of_levels,number_of_timesteps))
+
+      # Total tracer mass?
+      return 'tracer', conversion_plan(model, [fieldname,'dp','blended_area'], ['kg kg(air)-1', 'Pa', 'm2'], maximize=(number_of_levels,number_of_timesteps))
+
+    # Otherwise, if we only need air mass, assume a lid of 0hPa and take a
+    # shortcut
+    elif fieldname == 'air':
+       return 'surface_pressure', model.find_best(['surface_pressure','blended_area'], maximize=number_of_timesteps)
+
+    raise KeyError("No 'dp' field found in '%s'.  Cannot compute total mass."%model.name)
+
   # Total mass (Pg)
   def _compute_totalmass (self, model, cache=True):
-    from ..common import can_convert, convert, find_and_convert, grav as g, number_of_levels, number_of_timesteps, remove_repeated_longitude
+    from ..common import convert, grav as g, remove_repeated_longitude
     fieldname = self.fieldname
     suffix = self.suffix
 
     specie = None
 
-    # Do we have the pressure change in the vertical?
-    if model.have('dp'):
+    method, fields = self._totalmass_plan(model)
 
-      # Total air mass?
-      if fieldname == 'air':
-       dp, area = model.find_best(['dp','blended_area'], maximize=(number_of_levels,number_of_timesteps))
+    # Total air mass?
+    if method == 'air':
+       dp, area = fields
        # Integrate to get total column
        dp = convert(dp,'Pa')
        tc = dp.sum('zaxis') / g
 
-      # Total tracer mass?
-      else:
-       try:
-         c, dp, area = find_and_convert(model, [fieldname,'dp','blended_area'], ['kg kg(air)-1', 'Pa', 'm2'], maximize=(number_of_levels,number_of_timesteps))
-         specie = c.atts.get('specie',None)
-       except ValueError:
-         #raise ValueError("Don't know how to compute mass from units of '%s'"%c.atts['units'])
-         raise
+    # Total tracer mass?
+    elif method == 'tracer':
+       c, dp, area = fields.apply()
+       specie = c.atts.get('specie',None)
 
        c = c.as_type('float64')
        # Integrate to get total column
        tc = (c*dp).sum('zaxis') / g
 
-    # Otherwise, if we only need air mass, assume a lid of 0hPa and take a
-    # shortcut
-    elif fieldname == 'air':
+    # Air mass from surface pressure.
+    elif method == 'surface_pressure':
        from warnings import warn
-       p0, area = model.find_best(['surface_pressure','blended_area'], maximize=number_of_timesteps)
+       p0, area = fields
        warn ("No 'dp' data found in '%s'.  Approximating total air mass from surface pressure"%model.name)
        p0 = convert(p0,'Pa')
        tc = p0 / g
-    else:
-       raise KeyError("No 'dp' field found in '%s'.  Cannot compute total mass."%model.name)
 
     # Integrate horizontally
     # Assume global grid - remove repeated longitude
@@ -164,7 +182,7 @@ class Totalmass(TimeVaryingDiagnostic,ImageDiagnostic):
 
     # Cache the data
     if cache:
-      data =  model.cache.write(data,prefix=model.name+"_totalmass_"+fieldname+suffix, force_single_precision=False, suffix=self.end_suffix)
+      data =  model.cache.write(data,prefix=model.name+"_totalmass_"+fieldname+suffix, force_single_precision=False, suffix=self.end_suffix, access=self.cache_access)
     return data
 
   # Integrated flux (moles per second)
@@ -200,7 +218,7 @@ class Totalmass(TimeVaryingDiagnostic,ImageDiagnostic):
 
     # Cache the data
     if cache:
-      data =  model.cache.write(data,prefix=model.name+"_totalflux_"+fieldname+suffix, force_single_precision=False, suffix=self.end_suffix)
+      data =  model.cache.write(data,prefix=model.name+"_totalflux_"+fieldname+suffix, force_single_precision=False, suffix=self.end_suffix, access=self.cache_access)
     return data
 
 
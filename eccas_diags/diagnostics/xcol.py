@@ -25,20 +25,22 @@
 # comparable to satellite observations.
 
 
-from . import TimeVaryingDiagnostic
+from . import TimeVaryingDiagnostic, MovieDiagnostic
 from .map import Map
-class XCol(TimeVaryingDiagnostic,Map):
+class XCol(TimeVaryingDiagnostic,Map,MovieDiagnostic):
   """
   Show the average column of a field, animated in time.  Note that no averaging
   kernel is used in the average, it is simply weighted by air mass.
   """
+  shared_reads = True  # Column averages are computed through the cache.
+  cache_access = 'map'
   def _select_inputs (self, inputs):
     inputs = super(XCol,self)._select_inputs(inputs)
     selected = []
     for inp in inputs:
       # Use any inputs that we can successfully compute an avg column from.
       try:
-        xcol = self._avgcolumn(inp,cache=False)
+        self._avgcolumn_plan(inp)
         selected.append(inp)
       except KeyError: pass
 
@@ -70,18 +72,26 @@ class XCol(TimeVaryingDiagnostic,Map):
 
     # Cache the data
     if cache:
-      data = model.cache.write(data,prefix=model.name+"_totalcolumn_"+fieldname+self.suffix, suffix=self.end_suffix)
+      data = model.cache.write(data,prefix=model.name+"_totalcolumn_"+fieldname+self.suffix, suffix=self.end_suffix, access=self.cache_access)
 
     data = rotate_grid(data)
     return data
 
 
+  # Find the fields needed for the average column of a tracer (without
+  # doing any calculations).
+  # Raises KeyError if they're not available.
+  def _avgcolumn_plan (self, model, fieldname=None):
+    from ..common import conversion_plan, number_of_levels, number_of_timesteps
+    fieldname = fieldname or self.fieldname
+    return conversion_plan(model, [fieldname,'dp'], [self.units,'Pa'], maximize=(number_of_levels,number_of_timesteps))
+
   # Compute average column of a tracer
   def _avgcolumn (self, model, fieldname=None, cache=True):
-    from ..common import find_and_convert, number_of_levels, number_of_timesteps, rotate_grid
+    from ..common import rotate_grid
     fieldname = fieldname or self.fieldname
 
-    c, dp = find_and_convert(model, [fieldname,'dp'], [self.units,'Pa'], maximize=(number_of_levels,number_of_timesteps))
+    c, dp = self._avgcolumn_plan(model, fieldname).apply()
 
     data = (c*dp).sum('zaxis') / dp.sum('zaxis')
     data.name = fieldname
@@ -92,7 +102,7 @@ class XCol(TimeVaryingDiagnostic,Map):
 
     # Cache the data
     if cache:
-      data = model.cache.write(data,prefix=model.name+"_avgcolumn_"+fieldname+self.suffix, suffix=self.end_suffix)
+      data = model.cache.write(data,prefix=model.name+"_avgcolumn_"+fieldname+self.suffix, suffix=self.end_suffix, access=self.cache_access)
 
     data = rotate_grid(data)
     return data
@@ -118,7 +128,7 @@ class XCol(TimeVaryingDiagnostic,Map):
 
     movie = ContourMovie(fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio = aspect_ratio, cmaps=cmaps, cap_extremes=cap_extremes, extra_plotvar_args=self.plotvar_map_args)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 from . import table
 table['xcol'] = XCol
@@ -37,7 +37,7 @@ class XColEnKF(XCol):
     for inp in inputs:
       # In addition to the field, we need an ensembled spread.
       try:
-        spread = self._avgcolumn(inp,fieldname=self.fieldname+'_ensemblespread',cache=False)
+        self._avgcolumn_plan(inp,fieldname=self.fieldname+'_ensemblespread')
         selected.append(inp)
       except KeyError: pass
    
@@ -82,7 +82,7 @@ class XColEnKF(XCol):
 
     movie = ContourMovie(fields, title=title, subtitles=subtitles, shape=shape, aspect_ratio = aspect_ratio, cmaps=cmaps, cap_extremes=cap_extremes)
 
-    movie.save (outdir=self.outdir, prefix=prefix)
+    movie.save (outdir=self.outdir, prefix=prefix, **self.movie_args)
 
 from . import table
 table['xcol-enkf'] = XColEnKF
@@ -25,6 +25,8 @@ class ZonalMean(Diagnostic):
   """
   Zonal mean (or standard deviation) of a field.
   """
+  shared_reads = True  # Zonal means are computed through the cache.
+  cache_access = 'map'
 
   def __init__ (self, typestat='mean', **kwargs):
     super(ZonalMean,self).__init__(**kwargs)
@@ -42,7 +44,7 @@ class ZonalMean(Diagnostic):
 
   # Compute zonal mean.
   def _zonalmean (self, model, typestat=None):
-    from ..common import remove_repeated_longitude
+    from ..common import remove_repeated_longitude, nanstats
 
     fieldname = self.fieldname
     typestat = typestat or self.typestat
@@ -52,23 +54,15 @@ class ZonalMean(Diagnostic):
     # Remove any repeated longtiude (for global data)
     var = remove_repeated_longitude(var)
 
-    # Do the zonal mean
-    if typestat == "mean":
-      var_mean = var.nanmean('lon')
-    else:
-      # Make sure the zonal mean gets cached before use in subsequent
-      # calculations.
-      # Otherwise, it could cause an O(n^2) slowdown of the diagnostics.
-      var_mean = self._zonalmean (model, typestat="mean")
+    # Do the zonal mean and standard deviation together, in a single pass
+    # over the data (whichever one isn't needed right now is cached for
+    # later).
+    stats = sorted(set(['mean','stdev',typestat]))
+    requests = []
+    for stat, statvar in zip(stats, nanstats(var, 'lon', stats)):
+      statvar.name = fieldname
+      requests.append((statvar, dict(prefix=model.name+'_zonal'+stat+'_'+self.zaxis+'_'+fieldname+self.suffix, suffix=self.end_suffix, access=self.cache_access)))
+    cached = model.cache.write_many(requests)
 
-    # Do a zonal standard deviation
-    var_stdev = (var-var_mean).nanstdev('lon')
-    var_stdev.name = fieldname
-  
-    if typestat == "stdev" : var=var_stdev   
-    if typestat == "mean" : var=var_mean
-
-    var = model.cache.write(var, prefix=model.name+'_zonal'+typestat+'_'+self.zaxis+'_'+fieldname+self.suffix, suffix=self.end_suffix)
-
-    return var
+    return cached[stats.index(typestat)]
 
@@ -163,10 +163,17 @@ class DataProduct (DataInterface):
   # Indicates that the domains should not cross file boundaries.
   _per_file = False
 
+  # Indicates that write() always puts everything into the same file, so the
+  # data can't be written a piece at a time.
+  _single_output_file = False
+
   # Initialize a product interface.
   # Scans the provided files, and constructs the datasets.
-  def __init__ (self, files, name, desc=None, title='untitled', cache=None, rescan=False, color='black', linestyle='-', std_style='lines', marker=None, cmap='jet'):
+  # If consolidate_stations is True, then single-station datasets (one per
+  # file) are merged into multi-station datasets.
+  def __init__ (self, files, name, desc=None, title='untitled', cache=None, rescan=False, color='black', linestyle='-', std_style='lines', marker=None, cmap='jet', consolidate_stations=False):
     from .data_scanner import _Manifest, from_files
+    from .. import profiler
     from os.path import exists
     from os import remove
     from pygeode.dataset import asdataset
@@ -189,6 +196,8 @@ class DataProduct (DataInterface):
     manifest = _Manifest(manifest)
 
     expanded_files = self.expand_files(files)
+    # Remember where the data came from.
+    self.files = expanded_files
     if self._per_file:
       data = [from_files([f], type(self), manifest=manifest, save_manifest=False) for f in expanded_files]
       # Flush the manifest back to disk after all files are scanned.
@@ -200,8 +209,12 @@ class DataProduct (DataInterface):
 
 
     # Decode the data (get standard field names, etc.)
-    data = map(self.decode, data)
+    with profiler.timer('decode'):
+      data = map(self.decode, data)
     data = map(asdataset, data)
+    if consolidate_stations and self._per_file:
+      from ..station_data import consolidate_stations
+      data = consolidate_stations(data)
     # Store the data in this object.
     DataInterface.__init__(self,data)
 
@@ -237,12 +250,8 @@ class DerivedProduct (DataProduct):
 
 
 # Find all available interfaces
-table = {}
-def _load_interfaces ():
-  import pkgutil
-  import importlib
-  for loader, name, ispkg in pkgutil.walk_packages(__path__):
-    if ispkg: continue
-    importlib.import_module(__name__+'.'+name)
-_load_interfaces()  # Allow the interfaces to add their entries to this table
+# (the modules are only imported when their entries are first used)
+from ..registry import LazyTable
+table = LazyTable(__name__, __path__)
+del LazyTable
 
@@ -30,6 +30,8 @@ __all__ = ['AxisManager','DataInterface','from_files']
 # is re-generated.
 _MANIFEST_VERSION="3"
 
+from .. import profiler
+
 # Interface for creating / reading a manifest file.
 class _Manifest(object):
 
@@ -80,6 +82,7 @@ class _Manifest(object):
     self.selected_files = []
 
   # Scan through all the given files, add the info to the manifest.
+  @profiler.timed('scan_files')
   def scan_files (self, files, opener):
     from os.path import getmtime, normpath
     from pygeode.progress import PBar
@@ -603,6 +606,7 @@ def _get_var_info(manifest,opener):
   return atts, table
 
 # Find all datasets that can be constructed from a set of files.
+@profiler.timed('from_files')
 def from_files (filelist, interface, manifest=None, save_manifest=True, opener_args={}):
   """
   Scans the given files using the specified interface.  Determines all the
@@ -704,10 +708,12 @@ class _DataVar(Var):
 
     return obj
 
+  @profiler.timed('read_data')
   def getview (self, view, pbar):
 
     import numpy as np
     from pygeode.view import View, simplify
+    profiler.add_bytes('read_data', np.prod(view.shape)*np.dtype(self.dtype).itemsize)
     out = np.empty(view.shape, dtype=self.dtype)
     out[()] = float('nan')
     out_axes = view.clip().axes
@@ -763,6 +769,11 @@ class _DataVar(Var):
 del Var
 
 
+# Counters for the dataset queries (how often the index was used, etc.)
+from collections import defaultdict
+lookup_stats = defaultdict(int)
+del defaultdict
+
 # A generic data interface.
 # Essentially, a collection of datasets, with some convenience methods.
 class DataInterface (object):
@@ -775,6 +786,38 @@ class DataInterface (object):
     from pygeode.dataset import asdataset
     self.datasets = tuple(map(asdataset,datasets))
 
+  # The datasets are indexed by variable (and axis) names, so the queries
+  # below don't need to check every dataset.
+  # The index is rebuilt whenever the datasets are replaced.
+  @property
+  def datasets (self):
+    return self._datasets
+  @datasets.setter
+  def datasets (self, datasets):
+    index = {}
+    for i, dataset in enumerate(datasets):
+      names = set(v.name for v in dataset.vars) | set(a.name for a in dataset.axes)
+      for name in names:
+        index.setdefault(name,[]).append(i)
+    self._datasets = tuple(datasets)
+    self._index = index
+    self._best = {}
+    self._plans = {}
+
+  # Get the datasets that might contain all of the given variables.
+  def _candidates (self, vars):
+    if len(vars) == 0:
+      return self.datasets
+    try:
+      matches = set.intersection(*[set(self._index[v]) for v in vars])
+    except KeyError:
+      # Not in the index?  Then it's not in any of the datasets.
+      lookup_stats['index_misses'] += 1
+      return []
+    lookup_stats['index_hits'] += 1
+    lookup_stats['datasets_skipped'] += len(self.datasets) - len(matches)
+    return [self.datasets[i] for i in sorted(matches)]
+
   # Allow the underlying datasets to be iterated over
   def __iter__ (self):
     return iter(self.datasets)
@@ -801,7 +844,8 @@ class DataInterface (object):
     if len(kwargs) > 0:
       raise TypeError("Unexpected keyword arguments: %s"%kwargs.keys())
 
-    for dataset in self.datasets:
+    lookup_stats['find'] += 1
+    for dataset in self._candidates(vars):
       # Check if this dataset meets any extra requirements
       if requirement is not None:
         if not requirement(dataset):
@@ -817,7 +861,8 @@ class DataInterface (object):
     """
     Checks if the specified variable is available in the datasets.
     """
-    for dataset in self.datasets:
+    lookup_stats['have'] += 1
+    for dataset in self._candidates([var]):
       if var in dataset: return True
     return False
 
@@ -852,6 +897,21 @@ class DataInterface (object):
 
     """
 
+    lookup_stats['find_best'] += 1
+    # Re-use the result of an identical query.
+    # Only done for plain queries by name, since the criteria functions are
+    # usually created on the fly (and would never match a previous query).
+    if requirement is None and maximize is None and minimize is None:
+      key = varnames if isinstance(varnames,str) else tuple(varnames)
+      result = self._best.get(key)
+    else:
+      key = None
+      result = None
+    if result is not None:
+      lookup_stats['find_best_memoized'] += 1
+      if isinstance(result,KeyError): raise result
+      return result
+
     # If we are given a single field name (not in a list), then return a
     # single field (also not in a list structure).
     collapse_result = False
@@ -890,12 +950,15 @@ class DataInterface (object):
       candidates = sorted(candidates, key=minimize)
 
     if len(candidates) == 0:
-      raise KeyError("Unable to find any matches for varnames=%s, requirement=%s, maximize=%s, minimize=%s"%(varnames, requirement, maximize, minimize))
+      error = KeyError("Unable to find any matches for varnames=%s, requirement=%s, maximize=%s, minimize=%s"%(varnames, requirement, maximize, minimize))
+      if key is not None: self._best[key] = error
+      raise error
 
     # Use the best result
     result = candidates[0]
 
     if collapse_result: result = result[0]
+    if key is not None: self._best[key] = result
     return result
 
 
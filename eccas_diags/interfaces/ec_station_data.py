@@ -72,27 +72,11 @@ class EC_Station_Data(SplitProduct):
   )
 
 
-  # Method to open a single file
+  # Parse the text of a single file.
+  # Returns the time / data columns, or None if the format is unrecognized.
   @staticmethod
-  def open_file (filename):
-
+  def parse_file (filename):
     import numpy as np
-    from pygeode.timeaxis import StandardTime
-    from pygeode import Var
-    from pygeode.dataset import asdataset
-    from os.path import basename
-    from ..station_data import Station
-
-    station, tracer, period = basename(filename).rstrip('.DAT').rsplit('-',2)
-
-    # Try looking up the station.  Report an error if it's not found in the table.
-    try:
-      lat, lon, elevation, country = obs_locations[station]
-    except KeyError:
-      print "Warning: ec-station-obs: %s not found in the table."%station
-      return asdataset([])
-
-    station = Station([station], station=[station], lat=[lat], lon=[lon], elevation=[elevation], country=[country])
 
     # Read the data and put each column into an array.
     with open(filename, "r") as f:
@@ -100,59 +84,96 @@ class EC_Station_Data(SplitProduct):
 
       # Case 1: comma-separate data format
       if header.startswith('DecimalYear'):
-        data = zip(*[line.rstrip('\n').split(',') for line in f])
-        # Skip files with no data.
+        data = np.loadtxt(f, dtype=str, delimiter=',', ndmin=2)
         if len(data) == 0:
-           print "Warning: ec-station-obs: %s has no data for %s."%(station,tracer)
-           return asdataset([])
+          data = np.empty((0,9), dtype=str)
         # More recent datasets contain a "DecimalDay" column.
         # Ignore that column, so the column indices are compatible with
         # previous versions.
-        if 'DecimalDay' in header:
-          data = data[0:1] + data[2:]
+        elif 'DecimalDay' in header:
+          data = np.delete(data, 1, axis=1)
 
-        year    = np.array ([int(x) for x in data[1]])
+        year    = data[:,1].astype(int)
         month   = np.ones (len(year),dtype=int)
         # This is actually day-of-year, but will get auto-wrapped when the
         # timeaxis is created.
-        day     = np.array ([int(x) for x in data[2]])
-        hourend = np.array ([int(x) for x in data[3]])
-        mean    = np.array ([float(x) for x in data[4]])
-        maxval  = np.array ([float(x) for x in data[5]])
-        minval  = np.array ([float(x) for x in data[6]])
-        std     = np.array ([float(x) for x in data[7]])
-        nval    = np.array ([int(x) for x in data[8]])
+        day     = data[:,2].astype(int)
+        hourend = data[:,3].astype(int)
+        mean    = data[:,4].astype(float)
+        maxval  = data[:,5].astype(float)
+        minval  = data[:,6].astype(float)
+        std     = data[:,7].astype(float)
+        nval    = data[:,8].astype(int)
 
       # Case 2: alternate format with 25 comment lines then space-separated
       # data
       elif header.startswith('REM'):
         while not header.startswith('REM25'):
           header = f.readline()
-        data = zip(*[line.rstrip('\n').split() for line in f])
+        data = np.loadtxt(f, dtype=str, ndmin=2)
+        if len(data) == 0: data = np.empty((0,8), dtype=str)
 
-        year    = np.array ([int(x) for x in data[0]])
-        month   = np.array ([int(x) for x in data[1]])
-        day     = np.array ([int(x) for x in data[2]])
-        hourend = np.array ([int(x) for x in data[3]])
+        year    = data[:,0].astype(int)
+        month   = data[:,1].astype(int)
+        day     = data[:,2].astype(int)
+        hourend = data[:,3].astype(int)
         # Don't have mean/max/min, just a single value?
-        mean    = np.array ([float(x) for x in data[4]])
+        mean    = data[:,4].astype(float)
         maxval  = mean
         minval  = mean
-        std     = np.array ([float(x) for x in data[7]])
-        nval    = np.array ([int(x) for x in data[6]])
+        std     = data[:,7].astype(float)
+        nval    = data[:,6].astype(int)
 
       else:
-        print "Warning: ec-station-obs: %s has unrecognized format."%station
-        return asdataset([])
+        return None
+
+    # Filter out negative values
+    mean[mean<0] = float('nan')
+
+    return dict(year=year, month=month, day=day, hourend=hourend, mean=mean, maxval=maxval, minval=minval, std=std, nval=nval)
+
+  # Method to open a single file
+  @staticmethod
+  def open_file (filename):
+
+    import numpy as np
+    from pygeode.timeaxis import StandardTime
+    from pygeode import Var
+    from pygeode.dataset import asdataset
+    from os.path import basename
+    from ..station_data import Station, parse_cached
+
+    station, tracer, period = basename(filename).rstrip('.DAT').rsplit('-',2)
+
+    # Try looking up the station.  Report an error if it's not found in the table.
+    try:
+      lat, lon, elevation, country = obs_locations[station]
+    except KeyError:
+      print "Warning: ec-station-obs: %s not found in the table."%station
+      return asdataset([])
+
+    station = Station([station], station=[station], lat=[lat], lon=[lon], elevation=[elevation], country=[country])
+
+    data = parse_cached(filename, EC_Station_Data.parse_file)
+    if data is None:
+      print "Warning: ec-station-obs: %s has unrecognized format."%station
+      return asdataset([])
+
+    year    = data['year']
+    month   = data['month']
+    day     = data['day']
+    hourend = data['hourend']
+    mean    = data['mean']
+    maxval  = data['maxval']
+    minval  = data['minval']
+    std     = data['std']
+    nval    = data['nval']
 
     # Skip files with no data.
     if len(mean) == 0:
       print "Warning: ec-station-obs: %s has no data for %s."%(station,tracer)
       return asdataset([])
 
-    # Filter out negative values
-    mean[mean<0] = float('nan')
-
     # Define the time axis.  Use a consistent start date, so the various
     # station records can be more easily compared.
     taxis = StandardTime (year=year, month=month, day=day, hour=hourend, units='hours', startdate={'year':1980,'month':1,'day':1})
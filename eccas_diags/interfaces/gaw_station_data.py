@@ -36,77 +36,81 @@ class GAW_Station_Data(SplitProduct):
     ('CH4_std',  'CH4_std', 'ppb'),
   )
 
+  # Parse the text of a single file.
+  # Returns the comment lines, and the time / data columns.
+  @staticmethod
+  def parse_file (filename):
+    from ..station_data import datetime64_fields
+    from StringIO import StringIO
+    from re import search
+    import numpy as np
+    comments = []
+    lines = []
+    tz_fudge = None
+    with open(filename,'r') as f:
+      for line in f:
+        if line.startswith('C'):
+          comments.append(line.rstrip('\n'))
+          # Get time zone info
+          if line.startswith('C24 TIME ZONE: '):
+            fudge = search("UTC(.*)",line.rstrip('\n')).group(1)
+            if fudge == "": fudge = "0"
+            tz_fudge = -int(fudge)
+        else:
+          lines.append(line)
+
+    dtype = [('date1','S10'),('time1','S5'),('date2','S10'),('time2','S5'),('val','f8'),('nd','f8'),('sd','f8'),('f','S16'),('cs','S16'),('rem','S16')]
+    data = np.loadtxt(StringIO(''.join(lines)), dtype=dtype, ndmin=1)
+    if len(data) > 0 and tz_fudge is None:
+      raise AttributeError("Missing time zone information.")
+    # Check quality flags, ignore any suspicious data.
+    if '.noaa.' in filename:
+      data = data[data['f']=='...']
+
+    # In what universe does 24-hour time go from 1:00 to 24:00????
+    midnight = data['time1'] == '24:00'
+    time1 = np.where(midnight, '23:00', data['time1'])
+    time = np.array(np.char.add(np.char.add(data['date1'],'T'),time1), dtype='datetime64[m]')
+    time[midnight] += np.timedelta64(1,'h')
+    if tz_fudge is not None:
+      time += np.timedelta64(tz_fudge,'h')
+    year, month, day, hour, minute = datetime64_fields(time)
+
+    values = data['val']
+    values[values<0] = float('nan')
+    std = data['sd']
+    std[std<0] = float('nan')
+
+    return dict(comments=np.array(comments), year=year, month=month, day=day, hour=hour, minute=minute, values=values, std=std)
+
   # Method to open a single file
   @staticmethod
   def open_file (filename):
-    from datetime import datetime, timedelta
     from pygeode.var import Var
     from pygeode.timeaxis import StandardTime
     from pygeode.dataset import Dataset
     from ..common import best_type
-    from ..station_data import Station
+    from ..station_data import Station, parse_cached
     import numpy as np
-    from re import search
-    f = open(filename,'ro')
-    specie = 'Unknown'
-    comments = []
-    year = []
-    month = []
-    day = []
-    hour = []
-    minute = []
-    values = []
-    std = []
     try:
-
-      for line in f:
-        line = line.rstrip('\n')
-
-        # Get time zone info
-        if line.startswith('C24 TIME ZONE: '):
-          fudge = search("UTC(.*)",line).group(1)
-          if fudge == "": fudge = "0"
-          tz_fudge = timedelta(hours=-int(fudge))
-        # Get specie info
-        if line.startswith('C18 PARAMETER: '):
-          specie = line.split(':')[1].strip()
-
-        if line.startswith('C'):
-          comments.append(line)
-        else:
-          date1, time1, date2, time2, val, nd, sd, f, cs, rem = line.split()
-          # Check quality flags, ignore any suspicious data.
-          if '.noaa.' in filename and f != '...': continue
-
-          try:
-            fudge = tz_fudge
-          except NameError:
-            raise AttributeError("Missing time zone information.")
-
-          # In what universe does 24-hour time go from 1:00 to 24:00????
-          if time1 == '24:00':
-            time1 = '23:00'
-            fudge = fudge + timedelta(hours=1)
-
-          time = datetime.strptime(date1+' '+time1, "%Y-%m-%d %H:%M") + fudge
-          year.append(time.year)
-          month.append(time.month)
-          day.append(time.day)
-          hour.append(time.hour)
-          minute.append(time.minute)
-
-          val = float(val)
-          if val < 0: val = float('nan')
-          values.append(val)
-
-          sd = float(sd)
-          if sd < 0: sd = float('nan')
-          std.append(sd)
-
-    except (ValueError,AttributeError) as e:
+      parsed = parse_cached(filename, GAW_Station_Data.parse_file)
+    except (ValueError,AttributeError,IndexError) as e:
       print 'skipping %s - bad formatting'%filename
       print 'message:', e.message
       return Dataset([])
+    comments = list(parsed['comments'])
+    year = parsed['year']
+    month = parsed['month']
+    day = parsed['day']
+    hour = parsed['hour']
+    values = parsed['values']
+    std = parsed['std']
+
+    # Get specie info
+    specie = 'Unknown'
+    for line in comments:
+      if line.startswith('C18 PARAMETER: '):
+        specie = line.split(':')[1].strip()
 
     # Get station name
     assert 'STATION NAME:' in comments[6]
@@ -225,6 +225,9 @@ class GEOSCHEM_Data(DataProduct):
     dataset = DataProduct.encode.__func__(cls,dataset)
     return dataset
 
+  # Everything gets written into a single output file.
+  _single_output_file = True
+
   # Method to write data to file(s).
   @classmethod
   def write (cls, data_interface, dirname):
@@ -0,0 +1,156 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Journal of the diagnostics that were run, so they can be skipped on the
+# next run if nothing has changed.
+#
+# Each entry records a fingerprint of the inputs to the diagnostic (input
+# files and their modification times, configuration, command-line arguments,
+# version of the code), along with the output files it produced.
+
+
+# Compute a fingerprint from a collection of (JSON-serializable) things.
+def fingerprint (*parts):
+  import json
+  from hashlib import md5
+  return md5(json.dumps(parts, sort_keys=True, default=str)).hexdigest()
+
+# Fingerprint a list of files, from their names, sizes and modification times.
+def file_fingerprint (files):
+  from os import stat
+  info = []
+  for f in sorted(set(files)):
+    s = stat(f)
+    info.append((f, s.st_size, s.st_mtime))
+  return fingerprint(info)
+
+# Fingerprint the code of this package (and the driver script).
+def code_fingerprint (*extra_files):
+  from os.path import dirname
+  from os import walk
+  from hashlib import md5
+  files = list(extra_files)
+  for root, dirs, filenames in walk(dirname(__file__)):
+    dirs.sort()
+    files.extend(root+'/'+f for f in sorted(filenames) if f.endswith('.py'))
+  h = md5()
+  for f in files:
+    h.update(f)
+    with open(f) as fh:
+      h.update(fh.read())
+  return h.hexdigest()
+
+# Check if a filename mentions the given field name.
+# The name has to stand on its own (so 'CO' doesn't match 'CO2'), although it
+# can have a prefix in upper case (such as 'XCO2' for column averages).
+def _mentions (filename, fieldname):
+  import re
+  return re.search(r'(?<![a-z0-9])'+re.escape(fieldname)+r'(?![A-Za-z0-9])', filename) is not None
+
+# Get a snapshot of the files in a directory (with modification times).
+# Only files whose path (relative to the directory) mentions one of the given
+# field names are included.
+# The frames of the movies (images_* subdirectories) are skipped, since they're
+# only an intermediate step for making the movie files.
+def list_outputs (dirname, match):
+  from os import walk
+  from os.path import join, getmtime, relpath
+  outputs = {}
+  if len(match) == 0: return outputs
+  for root, dirs, filenames in walk(dirname):
+    dirs[:] = [d for d in dirs if not d.startswith('images_')]
+    for f in filenames:
+      f = join(root,f)
+      if not any(_mentions(relpath(f,dirname),m) for m in match): continue
+      try:
+        outputs[f] = getmtime(f)
+      except OSError: pass  # File removed while scanning
+  return outputs
+
+# Find the files that were created or modified between two snapshots.
+def new_outputs (before, after):
+  return sorted(f for f, mtime in after.iteritems() if before.get(f) != mtime)
+
+
+class Journal (object):
+  def __init__ (self, filename):
+    self.filename = filename
+    self.entries = self._load()
+
+  def _load (self):
+    import json
+    from os.path import exists
+    if exists(self.filename):
+      try:
+        with open(self.filename) as f:
+          return json.load(f)
+      except ValueError:
+        pass  # Corrupted journal - start over.
+    return {}
+
+  # Key for a particular invocation of a diagnostic.
+  @staticmethod
+  def key (*args, **kwargs):
+    import json
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+  # Check if the given invocation was already done with the same inputs,
+  # and its outputs are still around.
+  # If it didn't produce any outputs (and was supposed to), then it's always
+  # re-done.
+  def is_current (self, key, fingerprint):
+    from os.path import exists
+    entry = self.entries.get(key)
+    if entry is None: return False
+    if entry['fingerprint'] != fingerprint: return False
+    if len(entry['outputs']) == 0 and entry.get('expect_outputs',True): return False
+    return all(exists(f) for f in entry['outputs'])
+
+  # Record a successful invocation.
+  # Re-reads the journal first, to pick up anything recorded by other
+  # processes working on the same output directory.  The journal is locked
+  # in the meantime, so the other processes can't update it at the same time.
+  # expect_outputs should be False for things that don't produce any output
+  # files (e.g. only write to the cache).
+  def record (self, key, fingerprint, outputs, expect_outputs=True):
+    import fcntl
+    with open(self.filename+'.lock','a') as lock:
+      fcntl.lockf(lock, fcntl.LOCK_EX)
+      try:
+        self.entries = self._load()
+        self.entries[key] = dict(fingerprint=fingerprint, outputs=list(outputs), expect_outputs=expect_outputs)
+        self.save()
+      finally:
+        fcntl.lockf(lock, fcntl.LOCK_UN)
+
+  # Write the journal back to disk.
+  # Written to a temporary file first, so an interrupted run doesn't leave a
+  # truncated journal.
+  def save (self):
+    import json
+    from os import rename
+    from socket import gethostname
+    from os import getpid
+    tmpfile = "%s.tmp.%s.%d"%(self.filename, gethostname(), getpid())
+    with open(tmpfile,'w') as f:
+      json.dump(self.entries, f, indent=1, sort_keys=True)
+    rename(tmpfile, self.filename)
+
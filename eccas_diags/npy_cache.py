@@ -0,0 +1,147 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+
+# Raw array format for the cache files.
+#
+# Each cached variable is stored as two files:
+#   <name>.npy  - the data values, as a raw numpy array.
+#   <name>.json - a description of the variable (name, attributes, and the
+#                 axes it's defined on).
+#
+# The .npy file is memory-mapped when opened, so reading a single timestep,
+# or a timeseries at a single point, only touches the part of the file that
+# is needed (no decompression or reformatting).
+# The files can be converted to netCDF (e.g. for sharing) with Cache.export().
+
+
+# Location of the description file.
+def _sidecar (filename):
+  from os.path import splitext
+  return splitext(filename)[0] + '.json'
+
+# Convert numpy types into something that can be written to JSON.
+def _jsonify (x):
+  if hasattr(x,'tolist'): return x.tolist()
+  return str(x)
+
+# Describe an axis (enough information to reconstruct it later).
+def _encode_axis (axis):
+  from pygeode.timeaxis import Time
+  entry = dict(module = type(axis).__module__, cls = type(axis).__name__,
+               name = axis.name, values = axis.values.tolist(),
+               dtype = axis.values.dtype.str, atts = dict(axis.atts))
+  # Time axes are reconstructed from their units and start date (the
+  # auxiliary arrays are derived from these).
+  if isinstance(axis,Time):
+    entry['units'] = axis.units
+    entry['startdate'] = axis.startdate
+  else:
+    entry['auxarrays'] = dict((name,values.tolist()) for name,values in axis.auxarrays.iteritems())
+  return entry
+
+# Reconstruct an axis from its description.
+def _decode_axis (entry):
+  import numpy as np
+  from pygeode.axis import NamedAxis
+  from pygeode.timeaxis import Time
+  values = np.array(entry['values'], dtype=entry['dtype'])
+  try:
+    module = __import__(entry['module'], fromlist=[entry['cls']])
+    cls = getattr(module, entry['cls'])
+    if issubclass(cls,Time):
+      return cls(values=values, units=entry['units'], startdate=entry['startdate'])
+    auxarrays = dict((name,np.array(v)) for name,v in entry['auxarrays'].iteritems())
+    return cls(values, name=entry['name'], atts=entry['atts'], **auxarrays)
+  # Fall back to a generic axis if the original type can't be reconstructed
+  # (e.g. the module that defined it isn't available).
+  except (ImportError, AttributeError, TypeError, ValueError):
+    return NamedAxis(values, name=entry['name'], atts=entry['atts'])
+
+
+# Save a variable to a .npy file (along with its description).
+# The description is written first, so the presence of the .npy file means
+# both are complete.
+def save (filename, var):
+  import json
+  import numpy as np
+  from os import rename
+  from .cache import _tmpfile
+  info = dict(name = var.name, atts = dict(var.atts), dtype = var.dtype.str,
+              shape = list(var.shape), axes = map(_encode_axis, var.axes))
+  sidecar = _sidecar(filename)
+  tmpfile = _tmpfile(sidecar)
+  with open(tmpfile,'w') as f:
+    json.dump(info, f, indent=1, sort_keys=True, default=_jsonify)
+  rename(tmpfile, sidecar)
+  # (use a file handle, so numpy doesn't tack on another .npy extension).
+  tmpfile = _tmpfile(filename)
+  with open(tmpfile,'wb') as f:
+    np.save(f, np.ascontiguousarray(var.get(), dtype=var.dtype))
+  rename(tmpfile, filename)
+
+# Open a variable that was saved with save().
+def load (filename):
+  import json
+  import numpy as np
+  from .common import strip_unicode
+  with open(_sidecar(filename)) as f:
+    info = strip_unicode(json.load(f))
+  data = np.load(filename, mmap_mode='r')
+  if list(data.shape) != info['shape']:
+    raise IOError("Shape of '%s' %s does not match its description %s."%(filename,data.shape,tuple(info['shape'])))
+  axes = map(_decode_axis, info['axes'])
+  return MemmapVar(axes, data, name=info['name'], atts=info['atts'])
+
+# A variable backed by a memory-mapped array.
+# Where possible, the requested indices are turned into slices, so the data
+# is read straight out of the memory map (only the pages that are needed).
+# The result is a copy, so it can be modified in-place like any other data.
+from pygeode.var import Var
+class MemmapVar(Var):
+  def __init__ (self, axes, data, name, atts):
+    from pygeode.var import Var
+    Var.__init__(self, axes, dtype=data.dtype, name=name, atts=atts)
+    self._data = data
+  def getview (self, view, pbar):
+    import numpy as np
+    slices = []
+    fancy = []
+    for i, ind in enumerate(view.integer_indices):
+      ind = np.asarray(ind)
+      if len(ind) == 0:
+        slices.append(slice(0,0))
+        continue
+      step = ind[1]-ind[0] if len(ind) > 1 else 1
+      if step > 0 and np.all(np.diff(ind) == step):
+        slices.append(slice(ind[0], ind[-1]+1, step))
+      else:
+        # Irregular indices - take the whole axis, and pick out the values
+        # afterwards.
+        slices.append(slice(None))
+        fancy.append((i,ind))
+    out = np.array(self._data[tuple(slices)])
+    for i, ind in fancy:
+      out = np.take(out, ind, axis=i)
+    pbar.update(100)
+    return out
+del Var
+
@@ -0,0 +1,131 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Timers and counters for the main stages of the diagnostics
+# (file scanning, decoding, data reads, cache writes, plotting, movies).
+#
+# The statistics are collected per "section" (e.g. one diagnostic on one
+# field), and can be written out as a JSON report at the end of the run.
+# Nothing is recorded unless the profiler is enabled.
+
+enabled = False
+
+# Statistics for each section.
+# sections[label] = {'wall_time':..., 'rss_change':..., 'peak_rss_increase':...,
+#                    'stages':{...}}
+# rss_change is the change in resident memory over the section, and
+# peak_rss_increase is how much the section raised the peak memory usage of
+# the process (zero if it stayed under an earlier peak).
+sections = {}
+
+# The section currently being profiled.
+_current = ['startup']
+
+# Stages currently being timed (to avoid double-counting recursive calls).
+_active = set()
+
+def _section (label=None):
+  label = label or _current[-1]
+  return sections.setdefault(label, dict(wall_time=0., rss_change=0, peak_rss_increase=0, stages={}))
+
+def _stage (name):
+  return _section()['stages'].setdefault(name, dict(calls=0, time=0., bytes=0))
+
+# Peak memory usage of the process (in bytes).
+def peak_rss ():
+  import resource
+  # Linux reports this in kilobytes.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Current memory usage of the process (in bytes).
+# Only available on Linux (returns 0 elsewhere).
+def current_rss ():
+  import resource
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * resource.getpagesize()
+  except (IOError, ValueError, IndexError):
+    return 0
+
+# Add to the number of bytes processed in a stage.
+def add_bytes (name, nbytes):
+  if not enabled: return
+  _stage(name)['bytes'] += int(nbytes)
+
+# Time a block of code as part of the given stage.
+class timer (object):
+  def __init__ (self, name):
+    self.name = name
+  def __enter__ (self):
+    from time import time
+    self.outer = enabled and self.name not in _active
+    if self.outer:
+      _active.add(self.name)
+      self.start = time()
+    return self
+  def __exit__ (self, *args):
+    from time import time
+    if self.outer:
+      _active.discard(self.name)
+      stage = _stage(self.name)
+      stage['calls'] += 1
+      stage['time'] += time() - self.start
+
+# Decorator for timing a function as part of the given stage.
+def timed (name):
+  def wrap (f):
+    from functools import wraps
+    @wraps(f)
+    def new_func (*args, **kwargs):
+      if not enabled: return f(*args, **kwargs)
+      with timer(name):
+        return f(*args, **kwargs)
+    return new_func
+  return wrap
+
+# Collect the statistics for a block of code under the given label.
+class section (object):
+  def __init__ (self, label):
+    self.label = label
+  def __enter__ (self):
+    from time import time
+    _current.append(self.label)
+    self.start = time()
+    if enabled:
+      self.start_rss = current_rss()
+      self.start_peak = peak_rss()
+    return self
+  def __exit__ (self, *args):
+    from time import time
+    _current.pop()
+    if not enabled: return
+    s = _section(self.label)
+    s['wall_time'] += time() - self.start
+    s['rss_change'] += current_rss() - self.start_rss
+    s['peak_rss_increase'] += peak_rss() - self.start_peak
+
+# Write the statistics to a JSON file.
+# Any extra keyword arguments are included in the report as-is.
+def report (filename, **extra):
+  import json
+  out = dict(extra, sections=sections, peak_rss=peak_rss())
+  with open(filename,'w') as f:
+    json.dump(out, f, indent=2, sort_keys=True)
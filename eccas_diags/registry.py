@@ -0,0 +1,132 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Lazy lookup table for the interfaces and diagnostics.
+#
+# Each module in the package registers its classes with a line like
+#   table['name'] = ClassName
+# Instead of importing every module up front (which pulls in pygeode_rpn,
+# matplotlib, scipy, etc.), the source files are scanned for these lines to
+# build an index of names -> modules.  A module is only imported the first
+# time one of its entries is accessed.
+
+from collections import MutableMapping
+class LazyTable (MutableMapping):
+  def __init__ (self, package, path):
+    self._package = package
+    self._modules = {}   # Which module each entry is defined in
+    self._classnames = {}  # Name of the class for each entry
+    self._loaded = {}    # Entries that have been imported
+    self._arg_classes = []  # Classes that define command-line arguments
+    self._scan(path)
+
+  # Build the index of entries from the source files.
+  def _scan (self, path):
+    import re
+    from glob import glob
+    from os.path import basename, join
+    pattern = re.compile(r"^table\[['\"]([^'\"]+)['\"]\]\s*=\s*(\w+)", re.M)
+    for dirname in path:
+      for filename in sorted(glob(join(dirname,'*.py'))):
+        module = basename(filename)[:-3]
+        with open(filename) as f:
+          source = f.read()
+        if 'def add_args' in source:
+          self._scan_args(module, filename, source)
+        if module == '__init__': continue
+        for name, classname in pattern.findall(source):
+          self._modules[name] = (module, filename)
+          self._classnames[name] = classname
+
+  # Find the classes that define an add_args method (for setting up
+  # command-line arguments).
+  def _scan_args (self, module, filename, source):
+    import ast
+    tree = ast.parse(source, filename)
+    for node in tree.body:
+      if not isinstance(node, ast.ClassDef): continue
+      if any(isinstance(n, ast.FunctionDef) and n.name == 'add_args' for n in node.body):
+        self._arg_classes.append((module, node.name))
+
+  # Import the module that defines the given entry.
+  def _load (self, name):
+    import importlib
+    module, filename = self._modules[name]
+    importlib.import_module(self._package+'.'+module)
+
+  def __getitem__ (self, name):
+    if name not in self._loaded and name in self._modules:
+      self._load(name)
+    return self._loaded[name]
+
+  # Called by the modules when they register their classes.
+  def __setitem__ (self, name, value):
+    self._loaded[name] = value
+
+  def __delitem__ (self, name):
+    self._modules.pop(name,None)
+    del self._loaded[name]
+
+  def __contains__ (self, name):
+    return name in self._modules or name in self._loaded
+
+  def __iter__ (self):
+    return iter(set(self._modules.keys()) | set(self._loaded.keys()))
+
+  def __len__ (self):
+    return len(set(self._modules.keys()) | set(self._loaded.keys()))
+
+  # Get the docstring for an entry, without importing the module (if possible).
+  def doc (self, name):
+    import ast
+    if name in self._loaded or name not in self._modules:
+      return self[name].__doc__
+    module, filename = self._modules[name]
+    with open(filename) as f:
+      tree = ast.parse(f.read(), filename)
+    for node in tree.body:
+      if isinstance(node, ast.ClassDef) and node.name == self._classnames[name]:
+        return ast.get_docstring(node, clean=False)
+    # Class is defined somewhere else?  Need to import it to find out.
+    return self[name].__doc__
+
+  # Add the command-line arguments for the given entries (default is all of
+  # them).
+  # To get the arguments for all the entries, only the modules that define
+  # arguments need to be imported (the other entries just inherit them).
+  def add_args (self, parser, names=None):
+    import importlib
+    if names is not None:
+      for name in sorted(names):
+        self[name].add_args(parser)
+      return
+    for module, classname in self._arg_classes:
+      if module == '__init__':
+        m = importlib.import_module(self._package)
+      else:
+        m = importlib.import_module(self._package+'.'+module)
+      getattr(m, classname).add_args(parser)
+
+  # Import all the entries.
+  def load_all (self):
+    for name in self._modules.keys():
+      if name not in self._loaded:
+        self._load(name)
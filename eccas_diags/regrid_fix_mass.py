@@ -22,68 +22,133 @@
 # Apply a global scale factor to the target 3D data, in order to have the
 # same mass as the source data.
 
-# Put the scaled field into a PyGeode operator, to speed it up.
-# Otherwise, will end up calculating things multiple times.
-from pygeode.var import Var
-class CachedVar (Var):
-  def __init__ (self, var, desc):
-    from pygeode.var import Var, copy_meta
-    self._var = var
-    self._desc = desc
-    self._cache = [None,None]  # Store info on last data request
-    Var.__init__(self, var.axes, dtype=var.dtype)
-    copy_meta (var, self)
-  def getview (self, view, pbar):
-    import numpy as np
-    import logging
-    logger = logging.getLogger(__name__)
-
-    # Use cached values?
-    last_key, cached_data = self._cache
-    key = tuple(map(tuple, view.integer_indices))
-    if key == last_key:
-      return cached_data
+# Current version of the mass budget file format.
+_BUDGET_VERSION = "2"
+
+# Evaluate a collection of global totals (scalar at each timestep) in a single
+# pass over the timesteps.
+# Inputs:
+#   totals: list of (name, var) pairs.  Each var should only have a time axis
+#           (or no axis at all).
+#   filename: (optional) sidecar file for storing the totals.  If it already
+#             contains the totals for the same timesteps, they are re-used.
+#   key: (optional) string identifying where the totals came from (input
+#        files, target grid, fields).  Stored totals are only re-used if they
+#        were computed with the same key.
+# Output: dictionary of the totals (as in-memory PyGeode Vars).
+def compute_totals (totals, filename=None, key=None):
+  from os.path import exists
+  from os import rename
+  from pygeode.var import Var, copy_meta
+  from pygeode.progress import PBar
+  import numpy as np
+  import gzip
+  import cPickle as pickle
+  import logging
+  logger = logging.getLogger(__name__)
 
+  # Identify the inputs and timesteps of each total (for checking the stored
+  # values).
+  def signature (var):
+    if not var.hasaxis('time'): return (key,)
+    return (key, var.time.units, tuple(sorted(var.time.startdate.items())), tuple(var.time.values))
+
+  # Try re-using the values from the sidecar file.
+  stored = {}
+  if filename is not None and exists(filename):
+    with gzip.open(filename,'r') as f:
+      version = pickle.load(f)
+      if version == _BUDGET_VERSION:
+        stored = pickle.load(f)
+      else:
+        logger.info("Ignoring mass budget file '%s' (version mismatch).", filename)
+
+  values = {}
+  todo = []
+  for name, var in totals:
+    if name in stored and stored[name][0] == signature(var):
+      values[name] = stored[name][1]
     else:
-
-      var = view.get(self._var)
-      logger.info(self._desc+": "+str(var.flatten()[0]))
-      self._cache[:] = key, var
-
+      if name in stored:
+        logger.info("Re-computing '%s' (inputs or timesteps changed since it was stored).", name)
+      todo.append((name,var))
+      values[name] = np.empty(var.shape, dtype='float64')
+
+  # Loop over timesteps, computing all the remaining totals at each timestep
+  # (so the shared inputs are only read once per timestep).
+  if len(todo) > 0:
+    nt = max([len(var.time) for name, var in todo if var.hasaxis('time')]+[1])
+    pbar = PBar (message = "Computing global totals")
+    for i in range(nt):
+      pbar.update(i*100./nt)
+      for name, var in todo:
+        if var.hasaxis('time'):
+          if i >= len(var.time): continue
+          values[name][i] = var(i_time=i).get().flatten()[0]
+        elif i == 0:
+          values[name][()] = var.get().flatten()[0]
     pbar.update(100)
 
-    return var
-
-
-del Var
-
-def global_scale (data, original_data, grid_data):
+    # Store everything in the sidecar file.
+    if filename is not None:
+      for name, var in todo:
+        stored[name] = (signature(var), values[name])
+      with gzip.open(filename+".tmp",'w') as f:
+        pickle.dump(_BUDGET_VERSION, f)
+        pickle.dump(stored, f)
+      rename(filename+".tmp", filename)
+
+  # Wrap the totals as PyGeode Vars.
+  out = {}
+  for name, var in totals:
+    out[name] = Var(var.axes, values=values[name])
+    copy_meta (var, out[name])
+  return out
+
+
+# Inputs:
+#   data: the regridded data.
+#   original_data: the data before regridding.
+#   grid_data: the target grid.
+#   budget_file: (optional) file for storing the global totals.
+#   budget_key: (optional) string identifying the input files (and any other
+#               options that affect the totals), for checking the stored
+#               totals.
+def global_scale (data, original_data, grid_data, budget_file=None, budget_key=None):
   from pygeode.var import copy_meta
-  from common import find_and_convert, remove_repeated_longitude
+  from common import find_and_convert, remove_repeated_longitude, TimestepMemo
   from interfaces import DataInterface
+  from cache import domain_hash
+  from journal import fingerprint
   import logging
   logger = logging.getLogger(__name__)
   scaled_dataset = []
   varnames = sorted(set(v.name for d in data.datasets for v in d))
 
+  # Share the source data between all the mass calculations.
+  cached_data = DataInterface([[TimestepMemo(v) for v in d] for d in data.datasets])
+  cached_original_data = DataInterface([[TimestepMemo(v) for v in d] for d in original_data.datasets])
+
+  # Set up the mass calculations (not evaluated yet).
+  totals = []
+  scaled_varnames = []
   for varname in varnames:
 
     var_test = data.find_best(varname)
     try:
       if varname in ('dry_air','dp','cell_area','gravity'):
         raise ValueError("need to keep this intact for proper unit conversion.")
-      original_mass = find_and_convert (original_data, varname, 'Pg')
+      original_mass = find_and_convert (cached_original_data, varname, 'Pg')
       original_mass = remove_repeated_longitude(original_mass)
       original_mass = original_mass.sum('lat','lon','zaxis')
-      original_mass = CachedVar(original_mass, "Expected %s mass"%varname)
-      current_mass = find_and_convert (data, varname, 'Pg')
+      current_mass = find_and_convert (cached_data, varname, 'Pg')
       current_mass = remove_repeated_longitude(current_mass)
       current_mass = current_mass.sum('lat','lon','zaxis')
-      current_mass = CachedVar(current_mass, "Uncorrected %s mass"%varname)
-      airmass = find_and_convert (data, 'dry_air', 'Pg')
-      airmass = remove_repeated_longitude(airmass)
-      airmass = airmass.sum('lat','lon','zaxis')
-      airmass = CachedVar(airmass, "Target air mass")
+      if len(totals) == 0:
+        airmass = find_and_convert (cached_data, 'dry_air', 'Pg')
+        airmass = remove_repeated_longitude(airmass)
+        airmass = airmass.sum('lat','lon','zaxis')
+        totals.append(('dry_air', airmass))
     except KeyError as e:
       logger.debug("Skipping '%s', since it's not in the original data.", varname)
       continue
@@ -92,6 +157,25 @@ def global_scale (data, original_data, grid_data):
       scaled_dataset.append(var_test)
       continue
 
+    totals.append((varname+'_original', original_mass))
+    totals.append((varname+'_current', current_mass))
+    scaled_varnames.append(varname)
+
+  # Compute all the global totals in one pass through the data.
+  # The stored totals are tied to the inputs, the fields, and the domain they
+  # were regridded to.
+  key = fingerprint(budget_key, varnames, [domain_hash(data.find_best(varname)) for varname in varnames])
+  totals = compute_totals (totals, filename=budget_file, key=key)
+
+  for varname in scaled_varnames:
+    var_test = data.find_best(varname)
+    original_mass = totals[varname+'_original']
+    current_mass = totals[varname+'_current']
+    airmass = totals['dry_air']
+    logger.info("Expected %s mass: %s", varname, original_mass.values.flatten()[0])
+    logger.info("Uncorrected %s mass: %s", varname, current_mass.values.flatten()[0])
+    logger.info("Target air mass: %s", airmass.values.flatten()[0])
+
     # Calculate the mass error, and distribute it equally in the atmosphere.
     offset = (current_mass-original_mass)/airmass
     copy_meta (var_test, offset)
@@ -104,5 +188,3 @@ def global_scale (data, original_data, grid_data):
     scaled_dataset.append(var)
 
   return DataInterface([scaled_dataset])
-
-
@@ -0,0 +1,215 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Helper methods for streaming the regridding pipeline one chunk of timesteps
+# at a time (instead of handing the whole lazy graph to the output writer).
+
+# Names of the stages in the regridding pipeline, in the order they're applied.
+stages = ('read', 'vertical', 'horizontal', 'mass-fix')
+
+# Wrap a variable so that the time spent fetching its data is recorded.
+# Note: the time includes any of the upstream stages needed to produce the
+# data.
+from pygeode.var import Var
+class TimedVar (Var):
+  def __init__ (self, var, stats):
+    from pygeode.var import Var, copy_meta
+    self._var = var
+    self._stats = stats
+    Var.__init__(self, var.axes, dtype=var.dtype)
+    copy_meta (var, self)
+  def getview (self, view, pbar):
+    from time import time
+    start = time()
+    data = view.get(self._var)
+    self._stats['seconds'] += time() - start
+    self._stats['bytes'] += data.nbytes
+    pbar.update(100)
+    return data
+del Var
+
+
+# Keeps track of the time / data volume for each stage of the pipeline.
+class StageTimers (object):
+  def __init__ (self):
+    self.stats = dict((stage,dict(seconds=0., bytes=0)) for stage in stages)
+
+  # Attach a timer to all the variables coming out of a particular stage.
+  def wrap (self, data, stage):
+    from interfaces import DataInterface
+    stats = self.stats[stage]
+    return DataInterface([[TimedVar(var,stats) for var in dataset] for dataset in data.datasets])
+
+  # Reset the counters (modified in-place, since the TimedVar objects hold
+  # references to them).
+  def reset (self):
+    for stats in self.stats.itervalues():
+      stats['seconds'] = 0.
+      stats['bytes'] = 0
+
+  # Get a copy of the current counters.
+  def snapshot (self):
+    return dict((stage,dict(stats)) for stage,stats in self.stats.iteritems())
+
+
+# Helper method - get the (year,month,day,...) of each time value.
+# Used for matching timesteps between variables that may have different time
+# units or reference dates.
+# Fields that aren't defined for the time axis are taken to be zero, so the
+# keys can be compared between axes with different resolutions.
+def _date_keys (taxis):
+  import numpy as np
+  fields = ('year','month','day','hour','minute','second')
+  zeros = np.zeros(len(taxis),dtype=int)
+  return zip(*[taxis.auxarrays.get(f,zeros) for f in fields])
+
+# Get all the timesteps in the data.
+def get_time_keys (data):
+  keys = set()
+  for dataset in data.datasets:
+    for var in dataset:
+      if var.hasaxis('time'):
+        keys.update(_date_keys(var.time))
+  return sorted(keys)
+
+# Split the timesteps of the data into chunks of the given size.
+def get_time_chunks (data, chunk_size):
+  keys = get_time_keys(data)
+  return [keys[i:i+chunk_size] for i in range(0,len(keys),chunk_size)]
+
+# Select a chunk of timesteps from the data.
+# Time-invariant fields are only included if include_static is True (so they
+# only get written once).
+def select_time_chunk (data, keys, include_static=False):
+  from interfaces import DataInterface
+  keys = set(keys)
+  datasets = []
+  for dataset in data.datasets:
+    varlist = []
+    for var in dataset:
+      if not var.hasaxis('time'):
+        if include_static: varlist.append(var)
+        continue
+      indices = [i for i,k in enumerate(_date_keys(var.time)) if k in keys]
+      if len(indices) == 0: continue
+      slices = [slice(None)]*var.naxes
+      slices[var.whichaxis('time')] = indices
+      varlist.append(var.slice[slices])
+    if len(varlist) > 0: datasets.append(varlist)
+  return DataInterface(datasets)
+
+
+# State shared with the worker processes.
+# (Set up before the workers are forked, so only the chunk number needs to be
+# passed to them).
+_state = {}
+
+# Process and write a single chunk of timesteps.
+def _write_chunk (ichunk):
+  from time import time
+  data = _state['data']
+  chunks = _state['chunks']
+  timers = _state['timers']
+  timers.reset()
+  start = time()
+  chunk = select_time_chunk(data, chunks[ichunk], include_static=(ichunk==0))
+  _state['out_interface'].write(chunk, _state['outdir'])
+  return ichunk, time()-start, timers.snapshot()
+
+# Format the throughput for each stage.
+# The time for a stage is taken as the difference from the previous stage
+# (since the timers include any upstream computations).
+def _format_stats (elapsed, stats):
+  MB = 1024.*1024.
+  out = []
+  previous = 0.
+  for stage in stages:
+    seconds = stats[stage]['seconds']
+    nbytes = stats[stage]['bytes']
+    if seconds == 0. and nbytes == 0: continue
+    own = max(seconds - previous, 0.)
+    previous = max(seconds, previous)
+    rate = nbytes/MB/seconds if seconds > 0 else float('nan')
+    out.append("%s: %.1fs %.1fMB (%.1fMB/s)"%(stage, own, nbytes/MB, rate))
+  out.append("write: %.1fs"%max(elapsed-previous,0.))
+  return ', '.join(out)
+
+# Write out the data, one chunk of timesteps at a time.
+# Inputs:
+#   data: the data to write (after all the regridding stages).
+#   out_interface: the interface to write the data with.
+#   outdir: where to write the data.
+#   timers: StageTimers object that was used to wrap each stage of the data.
+#   chunk_size: number of timesteps to process at a time.
+#   jobs: number of worker processes to use.
+def write_in_chunks (data, out_interface, outdir, timers, chunk_size=1, jobs=1):
+  from time import time
+  import logging
+  logger = logging.getLogger(__name__)
+
+  chunks = get_time_chunks(data, chunk_size)
+  # Special case: no time-varying data.
+  if len(chunks) == 0: chunks = [[]]
+
+  _state.update(data=data, chunks=chunks, timers=timers, out_interface=out_interface, outdir=outdir)
+
+  totals = dict((stage,dict(seconds=0., bytes=0)) for stage in stages)
+  chunk_seconds = 0.
+  start = time()
+  if jobs > 1:
+    from multiprocessing import Pool
+    pool = Pool(jobs)
+    results = pool.imap_unordered(_write_chunk, range(len(chunks)))
+  else:
+    pool = None
+    results = (_write_chunk(i) for i in range(len(chunks)))
+
+  try:
+    for n, (ichunk, elapsed, stats) in enumerate(results):
+      logger.info("Chunk %d/%d (%d timesteps) done in %.1fs - %s", ichunk+1, len(chunks), len(chunks[ichunk]), elapsed, _format_stats(elapsed, stats))
+      for stage in stages:
+        totals[stage]['seconds'] += stats[stage]['seconds']
+        totals[stage]['bytes'] += stats[stage]['bytes']
+      chunk_seconds += elapsed
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  elapsed = time() - start
+  nsteps = sum(len(c) for c in chunks)
+  logger.info("Wrote %d timesteps in %.1fs (%.2f timesteps/s)", nsteps, elapsed, nsteps/elapsed if elapsed > 0 else float('nan'))
+  # Note: with multiple jobs, the stage totals are summed over all workers.
+  logger.info("Stage totals - %s", _format_stats(chunk_seconds, totals))
+  _state.clear()
+
+  # Make sure nothing got lost along the way (e.g. a chunk that was
+  # overwritten by a later one).
+  check_output(out_interface, outdir, [k for c in chunks for k in c])
+
+# Re-scan the output directory, and check that all the given timesteps are
+# there.
+def check_output (out_interface, outdir, keys):
+  if len(keys) == 0: return
+  written = set(get_time_keys(out_interface(outdir, name='regrid_output')))
+  missing = sorted(set(keys) - written)
+  if len(missing) > 0:
+    raise ValueError("Only %d of %d timesteps were found in the output directory '%s'.  First missing timestep: %04d-%02d-%02d %02d:%02d:%02d"%((len(keys)-len(missing), len(keys), outdir) + tuple(missing[0])))
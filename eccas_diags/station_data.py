@@ -94,6 +94,152 @@ class Station (Axis):
 
 del Axis
 
+# Cache of parsed station data files.
+# Text files of station data are slow to parse, and get re-opened whenever
+# the data is read.  The parsed columns are kept in memory, and (optionally)
+# saved to a binary .npz file in the directory given here (created if it
+# doesn't exist yet).
+parsed_cache_dir = None
+_parsed = {}
+
+# Parse a file of station data, re-using previously parsed results if the
+# file hasn't been modified since.
+# The parser should return a dictionary of numpy arrays, or None if the file
+# can't be handled.
+def parse_cached (filename, parser):
+  from os.path import abspath, getmtime, exists, basename
+  from os import rename, remove, makedirs
+  from hashlib import md5
+  import numpy as np
+  filename = abspath(filename)
+  mtime = getmtime(filename)
+  key = (filename, parser.__name__)
+  if key in _parsed and _parsed[key][0] == mtime:
+    return _parsed[key][1]
+  cachefile = None
+  if parsed_cache_dir is not None:
+    cachefile = parsed_cache_dir + '/' + basename(filename) + '.' + md5(repr(key)).hexdigest()[:8] + '.npz'
+  data = None
+  if cachefile is not None and exists(cachefile):
+    try:
+      with np.load(cachefile) as npz:
+        if float(npz['_mtime']) == mtime:
+          data = dict((k,npz[k]) for k in npz.files if k != '_mtime')
+    except (IOError, ValueError, KeyError):
+      data = None
+  if data is None:
+    data = parser(filename)
+    if data is None: return None
+    if cachefile is not None:
+      try:
+        if not exists(parsed_cache_dir): makedirs(parsed_cache_dir)
+      except OSError: pass  # Created by another process in the meantime?
+      try:
+        tmpfile = cachefile + '.tmp'
+        with open(tmpfile,'wb') as f:
+          np.savez(f, _mtime=mtime, **data)
+        rename(tmpfile, cachefile)
+      except (IOError, OSError):
+        pass  # Not a fatal problem, just need to re-parse next time.
+  _parsed[key] = (mtime, data)
+  return data
+
+# Split a datetime64 array into year, month, day, hour, minute components.
+def datetime64_fields (t):
+  import numpy as np
+  t = np.asarray(t, dtype='datetime64[m]')
+  year = t.astype('datetime64[Y]').astype(int) + 1970
+  month = t.astype('datetime64[M]').astype(int) % 12 + 1
+  day = (t.astype('datetime64[D]') - t.astype('datetime64[M]')).astype(int) + 1
+  minutes = (t - t.astype('datetime64[D]')).astype(int)
+  return year, month, day, minutes//60, minutes%60
+
+# Combine single-station datasets (e.g. one per obs file) into multi-station
+# datasets, so there are fewer datasets to search through.
+# Datasets with the same variables (on the same kind of time axis) are merged
+# together, with a combined station axis, and a combined time axis that's
+# padded with NaN where a station has no data.
+# Datasets that can't be merged are passed through as-is.
+def consolidate_stations (datasets):
+  from pygeode.dataset import Dataset
+  import numpy as np
+  groups = []
+  lookup = {}
+  for dataset in datasets:
+    vars = list(dataset)
+    key = None
+    if len(vars) > 0 and all([a.name for a in v.axes] == ['time','station'] and len(v.station) == 1 and np.all(np.diff(v.time.values) > 0) for v in vars):
+      time = vars[0].time
+      if all(v.time == time for v in vars):
+        key = (tuple(sorted(v.name for v in vars)), type(time), time.units, repr(sorted(time.startdate.items())))
+    if key is None:
+      groups.append([dataset])
+    elif key not in lookup:
+      lookup[key] = [dataset]
+      groups.append(lookup[key])
+    else:
+      lookup[key].append(dataset)
+
+  out = []
+  for group in groups:
+    if len(group) == 1:
+      out.append(group[0])
+      continue
+    varnames = [v.name for v in group[0]]
+    out.append(Dataset([MergedStations([dataset[varname] for dataset in group]) for varname in varnames]))
+  return out
+
+# Recover the single-station datasets from consolidate_stations().
+# The original (unpadded) data is used for each station.
+def split_stations (datasets):
+  from pygeode.dataset import Dataset
+  out = []
+  for dataset in datasets:
+    merged = [v for v in dataset if isinstance(v,MergedStations)]
+    if len(merged) == 0:
+      out.append(dataset)
+      continue
+    others = [v for v in dataset if not isinstance(v,MergedStations)]
+    for i in range(len(merged[0].sources)):
+      out.append(Dataset([v.sources[i] for v in merged]+others))
+  return out
+
+# A field from many single-station sources, combined along a station axis.
+from pygeode.var import Var
+class MergedStations (Var):
+  def __init__ (self, sources):
+    from pygeode.var import Var
+    from pygeode.axis import concat
+    from pygeode.tools import common_dict
+    import numpy as np
+    time = sources[0].time
+    values = np.unique(np.concatenate([v.time.values for v in sources]))
+    taxis = type(time)(values=values, units=time.units, startdate=time.startdate)
+    station = concat([v.station for v in sources])
+    # Use a floating-point type, so the missing timesteps can be filled with
+    # NaN (even for counts and other integer fields).
+    dtype = np.result_type(sources[0].dtype, np.float32)
+    Var.__init__(self, [taxis,station], name=sources[0].name, atts=common_dict([v.atts for v in sources]), dtype=dtype)
+    self.sources = sources
+    # Location of each source timestep on the combined time axis.
+    self.indices = [np.searchsorted(values, v.time.values) for v in sources]
+  def getview (self, view, pbar):
+    import numpy as np
+    out = np.empty(view.shape, dtype=self.dtype)
+    out[()] = float('nan')
+    itimes, istations = view.integer_indices
+    for j, s in enumerate(istations):
+      indices = self.indices[s]
+      if len(indices) == 0: continue
+      pos = np.searchsorted(indices, itimes)
+      pos[pos>=len(indices)] = 0
+      match = indices[pos] == itimes
+      if np.any(match):
+        out[match,j] = self.sources[s][pos[match],:][:,0]
+      pbar.update(100.*(j+1)/len(istations))
+    return out
+del Var
+
 # Convert a 1D string variable into a 2D character variable
 # (useful for encoding string arrays into netcdf)
 def encode_string_var (var):
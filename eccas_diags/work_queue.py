@@ -0,0 +1,199 @@
+###############################################################################
+# Copyright 2016 - Climate Research Division
+#                  Environment and Climate Change Canada
+#
+# This file is part of the "EC-CAS diags" package.
+#
+# "EC-CAS diags" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# "EC-CAS diags" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with "EC-CAS diags".  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# A queue of jobs, kept in a directory on a shared filesystem.
+#
+# The queue directory has the following structure:
+#   pending/   - jobs waiting to be run (one JSON file per job)
+#   claimed/   - jobs currently being run by a worker
+#   done/      - jobs that finished successfully
+#   failed/    - jobs that failed (with the error message)
+#   ready      - marker file, created once all the jobs are in the queue
+#
+# A worker claims a job by renaming it from pending/ to claimed/.  The rename
+# is atomic, so only one worker can get a particular job.  While the job is
+# running, the worker periodically touches the claimed file.  If a worker is
+# killed, its claim eventually goes stale, and the job is put back in pending/.
+# The touches come from a background thread, which can be held up by long
+# reads in compiled code, so the stale timeout should be well above the
+# running time of the longest job.
+
+_subdirs = ('pending', 'claimed', 'done', 'failed')
+
+def _load (filename):
+  import json
+  from .common import strip_unicode
+  with open(filename) as f:
+    return strip_unicode(json.load(f))
+
+class WorkQueue (object):
+  def __init__ (self, dirname, stale_timeout=21600):
+    from os.path import join, exists
+    from os import makedirs
+    self.dirname = dirname
+    self.stale_timeout = stale_timeout
+    for subdir in _subdirs:
+      d = join(dirname,subdir)
+      if not exists(d):
+        try:
+          makedirs(d)
+        except OSError: pass  # Created by another process in the meantime?
+
+  def _path (self, *args):
+    from os.path import join
+    return join(self.dirname, *args)
+
+  def _list (self, subdir):
+    from os import listdir
+    return sorted(f for f in listdir(self._path(subdir)) if f.endswith('.json'))
+
+  # Clear out any jobs from a previous run.
+  def reset (self):
+    from os import remove
+    from os.path import exists
+    if exists(self._path('ready')): remove(self._path('ready'))
+    for subdir in _subdirs:
+      for f in self._list(subdir):
+        remove(self._path(subdir,f))
+
+  # Put some jobs in the queue (each job is a JSON-serializable object).
+  # Marks the queue as ready once all the jobs are in.
+  def put (self, jobs):
+    import json
+    from os import rename
+    for i, job in enumerate(jobs):
+      name = "%05d.json"%i
+      # Write the file outside pending/, so workers never see a partial job.
+      tmpfile = self._path(name+'.tmp')
+      with open(tmpfile,'w') as f:
+        json.dump(job, f)
+      rename(tmpfile, self._path('pending',name))
+    open(self._path('ready'),'w').close()
+
+  # Wait until the jobs are in the queue.
+  def wait_ready (self, interval=10):
+    from os.path import exists
+    from time import sleep
+    while not exists(self._path('ready')):
+      sleep(interval)
+
+  # Claim the next available job.
+  # Returns (name, job), or None if there are no more jobs waiting.
+  def claim (self):
+    from os import rename, utime
+    for name in self._list('pending'):
+      try:
+        rename(self._path('pending',name), self._path('claimed',name))
+      except OSError:
+        continue  # Another worker got to it first.
+      # Start the clock for the stale check.
+      utime(self._path('claimed',name), None)
+      return name, _load(self._path('claimed',name))
+    return None
+
+  # Let the other processes know we're still working on a job.
+  def touch (self, name):
+    from os import utime
+    try:
+      utime(self._path('claimed',name), None)
+    except OSError:
+      pass  # Claim was taken away from us (declared stale)?
+
+  # Mark a job as finished.
+  # If an error message is given, the job is marked as failed.
+  def finish (self, name, error=None):
+    import json
+    from os import rename
+    try:
+      if error is None:
+        rename(self._path('claimed',name), self._path('done',name))
+      else:
+        job = _load(self._path('claimed',name))
+        tmpfile = self._path(name+'.tmp')
+        with open(tmpfile,'w') as f:
+          json.dump(dict(job=job, error=error), f)
+        rename(tmpfile, self._path('failed',name))
+        rename(self._path('claimed',name), self._path('done',name))
+    except (OSError, IOError):
+      pass  # Claim was taken away from us (and given to another worker).
+
+  # Put any stale claims (from workers that were killed) back in the queue.
+  def reclaim_stale (self):
+    from os import rename
+    from os.path import getmtime
+    from time import time
+    for name in self._list('claimed'):
+      try:
+        if time() - getmtime(self._path('claimed',name)) < self.stale_timeout: continue
+        rename(self._path('claimed',name), self._path('pending',name))
+        print "Reclaiming stale job %s"%name
+      except OSError:
+        pass  # Finished (or reclaimed) in the meantime.
+
+  # Check if everything in the queue is done.
+  def finished (self):
+    return len(self._list('pending')) == 0 and len(self._list('claimed')) == 0
+
+  # Get the failed jobs, as a list of (job, error message).
+  def failures (self):
+    out = []
+    for name in self._list('failed'):
+      entry = _load(self._path('failed',name))
+      out.append((entry['job'], entry['error']))
+    return out
+
+  # Run the jobs in the queue, until there are none left waiting.
+  # The given function is called on each job.  It should raise an exception
+  # if the job fails.
+  def work (self, func, crash=False):
+    from threading import Thread, Event
+    while True:
+      claimed = self.claim()
+      if claimed is None: return
+      name, job = claimed
+      # Keep the claim fresh while the job is running.
+      done = Event()
+      def heartbeat ():
+        while not done.wait(self.stale_timeout/4.):
+          self.touch(name)
+      thread = Thread(target=heartbeat)
+      thread.daemon = True
+      thread.start()
+      try:
+        func(job)
+        self.finish(name)
+      except Exception as e:
+        self.finish(name, error=str(e))
+        if crash: raise
+      finally:
+        done.set()
+        thread.join()
+
+  # Wait for all the jobs to be finished (by any worker), taking over any
+  # jobs that were abandoned along the way.
+  def wait (self, func, crash=False, interval=30):
+    from time import sleep
+    while True:
+      self.work(func, crash=crash)
+      if self.finished(): return
+      sleep(interval)
+      self.reclaim_stale()
+